@@ -0,0 +1,82 @@
+"""Benchmark for bulk student import against one-at-a-time registration.
+
+The sequential baseline does what the Register form does for each student: one
+bcrypt hash, then one connection and one transaction per insert. The import
+run logs in as an admin through AppTest, uploads the same students as a CSV
+and clicks Import Students. It then clicks Import again to time the resume
+pass, where every student already exists.
+
+Usage:
+    python benchmarks/bench_bulk_import.py --students 10000 --rounds 10
+"""
+import argparse
+import os
+import sqlite3
+import tempfile
+import time
+from contextlib import closing
+from pathlib import Path
+
+import bcrypt
+
+from bench_study_hub import logged_in_session, seed_users
+
+ADMIN = "student0"
+
+
+def sequential_baseline(students, rounds, db_path):
+    """Registers students one by one, like the Register form. Returns seconds taken."""
+    with closing(sqlite3.connect(db_path)) as conn, conn:
+        conn.execute("CREATE TABLE users (username TEXT PRIMARY KEY, hashed_password TEXT NOT NULL)")
+    started = time.perf_counter()
+    for username, password in students:
+        hashed = bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt(rounds=rounds))
+        with closing(sqlite3.connect(db_path, timeout=30)) as conn, conn:
+            conn.execute(
+                "INSERT INTO users (username, hashed_password) VALUES (?, ?)", (username, hashed.decode("utf-8"))
+            )
+    return time.perf_counter() - started
+
+
+def click_import(at):
+    """Clicks Import Students and returns (seconds, summary caption)."""
+    started = time.perf_counter()
+    at.button(key="import_students").click().run()
+    elapsed = time.perf_counter() - started
+    if at.exception:
+        raise RuntimeError(f"App raised during import: {at.exception[0].value}")
+    captions = [caption.value for caption in at.caption if "exists" in caption.value or "created" in caption.value]
+    return elapsed, captions[0] if captions else "(no summary)"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--students", type=int, default=10000)
+    parser.add_argument("--rounds", type=int, default=10, help="bcrypt cost for both runs")
+    parser.add_argument("--skip-baseline", action="store_true")
+    args = parser.parse_args()
+    os.environ["STUDY_HUB_BCRYPT_ROUNDS"] = str(args.rounds)
+    os.environ["STUDY_HUB_ADMINS"] = ADMIN
+
+    students = [(f"pupil{i}", f"pupil-pass-{i}") for i in range(args.students)]
+    csv_data = ("username,password\n" + "".join(f"{u},{p}\n" for u, p in students)).encode("utf-8")
+
+    with tempfile.TemporaryDirectory(prefix="study-hub-import-") as work_dir:
+        os.chdir(work_dir) # .user_data is relative to the working directory
+        print(f"{args.students} students, bcrypt cost {args.rounds}, {os.cpu_count()} CPUs")
+        if not args.skip_baseline:
+            seconds = sequential_baseline(students, args.rounds, Path(work_dir) / "baseline.db")
+            print(f"sequential  {seconds:8.1f} s  {args.students / seconds:8.1f} students/s")
+
+        seed_users(1)
+        at = logged_in_session(ADMIN)
+        at.default_timeout = 24 * 3600
+        at.file_uploader(key="import_csv").set_value(("students.csv", csv_data, "text/csv")).run()
+        seconds, summary = click_import(at)
+        print(f"bulk import {seconds:8.1f} s  {args.students / seconds:8.1f} students/s  ({summary})")
+        seconds, summary = click_import(at)
+        print(f"resume      {seconds:8.1f} s  {args.students / seconds:8.1f} students/s  ({summary})")
+
+
+if __name__ == "__main__":
+    main()
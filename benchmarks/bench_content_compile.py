@@ -0,0 +1,118 @@
+"""Benchmark for the compiled content stage against an earlier revision of the app.
+
+Runs the current app and the app at --baseline over a syllabus (content/ by
+default). Each runs in its own process and its own directory, so caches and
+TTS clips aren't shared. For every subtopic it reruns the page a few times,
+then clicks both Read Aloud buttons with the stub TTS backend. It reports:
+rerun latency, markdown characters sent per page, the render_markdown span
+(from the Prometheus export) and the text given to the TTS engine. The stub
+stores each clip as "en|False|<chunk>", so the clip sizes give the input size.
+
+Usage:
+    python benchmarks/bench_content_compile.py --baseline <revision before the compile stage> [--content DIR]
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+APP_NAME = "code (3).py"
+STUB_PREFIX_BYTES = len("en|False|")
+LEGACY_METRICS_EXPORT_WAIT_SECONDS = 16 # Revisions before STUDY_HUB_METRICS_EXPORT_SECONDS export every 15 s
+
+
+def measure_app(app_dir, content_dir, reruns):
+    """Worker: drives one copy of the app over every subtopic and returns its numbers."""
+    os.chdir(app_dir)
+    os.environ["STUDY_HUB_TTS_BACKEND"] = "stub"
+    os.environ["STUDY_HUB_BCRYPT_ROUNDS"] = "4"
+    os.environ["STUDY_HUB_CONTENT_DIR"] = content_dir
+    os.environ["STUDY_HUB_METRICS_FILE"] = str(Path(app_dir) / "metrics.prom")
+    os.environ["STUDY_HUB_TTS_CACHE_DIR"] = str(Path(app_dir) / "tts")
+    sys.path.insert(0, str(REPO_DIR / "benchmarks"))
+    from bench_study_hub import METRICS_EXPORT_WAIT_SECONDS, percentile, read_span
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file(str(Path(app_dir) / APP_NAME), default_timeout=60).run()
+    at.text_input(key="reg_user").input("bench")
+    at.text_input(key="reg_pass").input("benchpass")
+    at.text_input(key="reg_pass_confirm").input("benchpass")
+    next(button for button in at.button if button.label == "Register").click().run()
+    at.text_input(key="login_user").input("bench")
+    at.text_input(key="login_pass").input("benchpass")
+    at.button[0].click().run()
+
+    manifest = json.loads((Path(content_dir) / "manifest.json").read_text(encoding="utf-8"))
+    latencies, markdown_chars, pages = [], 0, 0
+    for subject, entry in manifest.items():
+        at.radio(key="subject_selector").set_value(subject).run()
+        for topic, subtopics in entry["topics"].items():
+            at.selectbox(key="topic_selector").set_value(topic).run()
+            for subtopic in subtopics:
+                at.radio(key="subtopic_selector").set_value(subtopic).run()
+                for _ in range(reruns):
+                    started = time.perf_counter()
+                    at.run()
+                    latencies.append(time.perf_counter() - started)
+                markdown_chars += sum(len(element.value) for element in at.markdown)
+                pages += 1
+                for key in ("tts_detail", "tts_notes"):
+                    at.button(key=key).click().run()
+                if at.exception:
+                    raise RuntimeError(f"App raised on {subtopic}: {at.exception[0].value}")
+
+    configurable = "STUDY_HUB_METRICS_EXPORT_SECONDS" in (Path(app_dir) / APP_NAME).read_text(encoding="utf-8")
+    time.sleep(METRICS_EXPORT_WAIT_SECONDS if configurable else LEGACY_METRICS_EXPORT_WAIT_SECONDS)
+    at.run()
+    span_sum, span_count = read_span(Path(app_dir) / "metrics.prom", "render_markdown")
+    # Revisions from before STUDY_HUB_TTS_CACHE_DIR keep clips in static/tts next to the app copy
+    clips = [*(Path(app_dir) / "tts").glob("*.mp3"), *(Path(app_dir) / "static" / "tts").glob("*.mp3")]
+    return {
+        "pages": pages,
+        "rerun_p50_ms": percentile(latencies, 0.50) * 1000,
+        "rerun_p95_ms": percentile(latencies, 0.95) * 1000,
+        "markdown_chars_per_page": markdown_chars / pages,
+        "render_markdown_us": span_sum / span_count * 1e6,
+        "tts_chunks": len(clips),
+        "tts_input_chars": sum(clip.stat().st_size - STUB_PREFIX_BYTES for clip in clips),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--baseline", required=True, help="git revision to compare the working tree with (from before the compile stage)")
+    parser.add_argument("--content", type=Path, default=REPO_DIR / "content", help="syllabus directory to render")
+    parser.add_argument("--reruns", type=int, default=5, help="timed reruns per subtopic page")
+    args = parser.parse_args()
+
+    baseline_source = subprocess.run(
+        ["git", "show", f"{args.baseline}:{APP_NAME}"], cwd=REPO_DIR, capture_output=True, check=True
+    ).stdout
+    with tempfile.TemporaryDirectory(prefix="study-hub-compile-") as work_dir:
+        app_dirs = {"baseline": Path(work_dir) / "baseline", "current": Path(work_dir) / "current"}
+        for name, app_dir in app_dirs.items():
+            app_dir.mkdir()
+            source = baseline_source if name == "baseline" else (REPO_DIR / APP_NAME).read_bytes()
+            (app_dir / APP_NAME).write_bytes(source)
+        # One fresh process per app, one at a time, so they neither share caches nor compete for CPU
+        with multiprocessing.get_context("spawn").Pool(1, maxtasksperchild=1) as pool:
+            results = dict(zip(app_dirs, pool.starmap(measure_app, [(str(d), str(args.content.resolve()), args.reruns) for d in app_dirs.values()])))
+
+    print(f"{results['current']['pages']} subtopic pages, baseline {args.baseline}")
+    for name, result in results.items():
+        print(
+            f"{name:8s} rerun p50 {result['rerun_p50_ms']:6.1f} ms  p95 {result['rerun_p95_ms']:6.1f} ms  "
+            f"markdown {result['markdown_chars_per_page']:7.0f} chars/page  "
+            f"render_markdown {result['render_markdown_us']:6.1f} us  "
+            f"TTS input {result['tts_input_chars']:6d} chars in {result['tts_chunks']} chunks"
+        )
+
+
+if __name__ == "__main__":
+    main()
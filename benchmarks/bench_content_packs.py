@@ -0,0 +1,142 @@
+"""Benchmark for per-rerun time and memory on a large synthetic syllabus.
+
+Writes a synthetic syllabus (10 subjects x 50 topics x 20 subtopics = 10k
+subtopics by default) as content packs, logs in through AppTest and opens random
+subtopics, each through the subject, topic and subtopic widgets. It then reruns
+the page as it stands, the way every interaction does. It reports the open and
+rerun latencies and the process RSS, now and at its peak (Linux /proc and
+getrusage).
+
+With --baseline REV, the same syllabus is also run the way the app held it
+before content packs. REV's script gets its module-level `syllabus = {...}`
+literal swapped for this syllabus, so every rerun rebuilds the whole dict. Each
+mode runs in a fresh process.
+
+Usage:
+    python benchmarks/bench_content_packs.py
+    python benchmarks/bench_content_packs.py --baseline a51164f
+"""
+import argparse
+import ast
+import json
+import multiprocessing
+import os
+import random
+import resource
+import subprocess
+import tempfile
+import time
+from pathlib import Path
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+APP_FILE = "code (3).py"
+
+
+def rss_mb():
+    """Current resident set size of this process, from /proc."""
+    for line in Path("/proc/self/status").read_text().splitlines():
+        if line.startswith("VmRSS:"):
+            return int(line.split()[1]) / 1024
+    return float("nan")
+
+
+def write_legacy_app(revision, content_dir, path):
+    """Writes revision's app with its syllabus literal replaced by the packs in content_dir."""
+    source = subprocess.run(
+        ["git", "show", f"{revision}:{APP_FILE}"], cwd=REPO_DIR, capture_output=True, text=True, check=True
+    ).stdout
+    manifest = json.loads((content_dir / "manifest.json").read_text(encoding="utf-8"))
+    syllabus = {
+        subject: json.loads((content_dir / entry["pack"]).read_text(encoding="utf-8"))
+        for subject, entry in manifest.items()
+    }
+    node = next(
+        node for node in ast.parse(source).body
+        if isinstance(node, ast.Assign) and any(getattr(target, "id", None) == "syllabus" for target in node.targets)
+    )
+    lines = source.splitlines(keepends=True)
+    lines[node.lineno - 1:node.end_lineno] = [f"syllabus = {syllabus!r}\n"]
+    path.write_text("".join(lines), encoding="utf-8")
+
+
+def measure_mode(baseline, shape, opens, reruns):
+    """Worker: opens random subtopics and reruns the page in one session. Returns timings and RSS."""
+    with tempfile.TemporaryDirectory(prefix="study-hub-packs-") as work_dir:
+        work_dir = Path(work_dir)
+        os.environ.update({
+            "STUDY_HUB_CONTENT_DIR": str(work_dir / "content"),
+            "STUDY_HUB_TTS_CACHE_DIR": str(work_dir / "tts"),
+        })
+        from bench_study_hub import APP_PATH, BENCH_PASSWORD, percentile, seed_users, write_synthetic_content
+        from streamlit.testing.v1 import AppTest
+
+        subjects, topics, subtopics = shape
+        write_synthetic_content(work_dir / "content", subjects, topics, subtopics, 5)
+        app_path = APP_PATH
+        if baseline:
+            app_path = work_dir / APP_FILE
+            write_legacy_app(baseline, work_dir / "content", app_path)
+        os.chdir(work_dir) # .user_data is relative to the working directory
+        seed_users(1)
+        rss_start = rss_mb()
+
+        at = AppTest.from_file(str(app_path), default_timeout=600)
+        at.run()
+        at.text_input(key="login_user").input("student0")
+        at.text_input(key="login_pass").input(BENCH_PASSWORD)
+        at.button[0].click().run()
+        rng = random.Random(0)
+        open_times, rerun_times = [], []
+        for _ in range(opens):
+            s, t, u = rng.randrange(subjects), rng.randrange(topics), rng.randrange(subtopics)
+            started = time.perf_counter()
+            at.radio(key="subject_selector").set_value(f"Subject {s}").run()
+            at.selectbox(key="topic_selector").set_value(f"Topic {s}.{t}").run()
+            at.radio(key="subtopic_selector").set_value(f"Subtopic {s}.{t}.{u}").run()
+            open_times.append(time.perf_counter() - started)
+            if at.exception or at.session_state["current_subtopic"] != f"Subtopic {s}.{t}.{u}":
+                raise RuntimeError(f"Subtopic {s}.{t}.{u} didn't open")
+        for _ in range(reruns):
+            started = time.perf_counter()
+            at.run()
+            rerun_times.append(time.perf_counter() - started)
+        return {
+            "open_p50_ms": percentile(open_times, 0.50) * 1000,
+            "rerun_p50_ms": percentile(rerun_times, 0.50) * 1000,
+            "rerun_p95_ms": percentile(rerun_times, 0.95) * 1000,
+            "rss_app_mb": rss_mb() - rss_start,
+            "rss_peak_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--subjects", type=int, default=10)
+    parser.add_argument("--topics", type=int, default=50, help="topics per subject")
+    parser.add_argument("--subtopics", type=int, default=20, help="subtopics per topic")
+    parser.add_argument("--opens", type=int, default=20, help="random subtopics opened")
+    parser.add_argument("--reruns", type=int, default=30, help="plain reruns timed afterwards")
+    parser.add_argument("--baseline", metavar="REV", help="also run REV's in-module syllabus on the same content")
+    args = parser.parse_args()
+
+    shape = (args.subjects, args.topics, args.subtopics)
+    modes = {"content packs": None}
+    if args.baseline:
+        modes[f"in-module {args.baseline}"] = args.baseline
+    # One fresh process per mode, one at a time, so caches and RSS aren't shared
+    with multiprocessing.get_context("spawn").Pool(1, maxtasksperchild=1) as pool:
+        results = dict(zip(modes, pool.starmap(
+            measure_mode, [(baseline, shape, args.opens, args.reruns) for baseline in modes.values()]
+        )))
+
+    print(f"{args.subjects * args.topics * args.subtopics} subtopics ({args.subjects}x{args.topics}x{args.subtopics})")
+    for name, result in results.items():
+        print(
+            f"{name:22s} open p50 {result['open_p50_ms']:7.1f} ms  "
+            f"rerun p50 {result['rerun_p50_ms']:7.1f} ms  p95 {result['rerun_p95_ms']:7.1f} ms  "
+            f"RSS +{result['rss_app_mb']:6.1f} MB (peak {result['rss_peak_mb']:6.1f} MB)"
+        )
+
+
+if __name__ == "__main__":
+    main()
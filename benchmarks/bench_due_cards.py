@@ -0,0 +1,135 @@
+"""Benchmark for picking a student's next due flashcard from a large review history.
+
+Writes a synthetic syllabus with 50k flashcards and gives one student a schedule
+row for every card plus 1M review records (about a fifth of the cards overdue).
+Then, through AppTest, it repeatedly clicks "Review Next Due Card", checks that
+the most overdue card opened, and grades it Good so the next click moves on. It
+reports the click latency and the in-app get_due_flashcards and
+count_due_flashcards times (the count runs on every rerun for the sidebar
+metric), read from the Prometheus metrics export. The same loop then runs again
+with the card_schedule_due index dropped, which shows what the index saves.
+
+Usage:
+    python benchmarks/bench_due_cards.py --cards 50000 --reviews 1000000 --picks 30
+"""
+import argparse
+import hashlib
+import json
+import os
+import random
+import sqlite3
+import tempfile
+import time
+from contextlib import closing
+from pathlib import Path
+
+from bench_study_hub import METRICS_EXPORT_WAIT_SECONDS, logged_in_session, percentile, read_span, seed_users, write_synthetic_content
+
+SUBJECTS, TOPICS, SUBTOPICS = 10, 10, 11 # 100 topics, each one large deck plus ten 5-card subtopics
+DUE_FRACTION = 0.2
+DAY_SECONDS = 86400
+
+
+def card_ids(content_dir):
+    """(card_id, subject, topic, subtopic, card_index) for every flashcard, with the app's flashcard ids."""
+    manifest = json.loads((content_dir / "manifest.json").read_text(encoding="utf-8"))
+    cards = []
+    for subject, entry in manifest.items():
+        pack = json.loads((content_dir / entry["pack"]).read_text(encoding="utf-8"))
+        for topic, subtopics in pack.items():
+            for subtopic, body in subtopics.items():
+                for i, card in enumerate(body["flashcards"]):
+                    card_id = hashlib.sha256(json.dumps([subject, topic, subtopic, card["q"]]).encode("utf-8")).hexdigest()[:16]
+                    cards.append((card_id, subject, topic, subtopic, i))
+    return cards
+
+
+def seed_history(cards, reviews, username, rng):
+    """Schedules every card for username and logs reviews review records across them."""
+    now = time.time()
+    with closing(sqlite3.connect(Path(".user_data") / "users.db")) as conn, conn:
+        conn.executemany(
+            "INSERT INTO card_schedule (username, card_id, subject, topic, subtopic, card_index, "
+            "ease, interval_days, repetitions, due_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                (username, card_id, subject, topic, subtopic, i, 2.5, 6.0, 2,
+                 now - rng.uniform(0, 30 * DAY_SECONDS) if rng.random() < DUE_FRACTION else now + rng.uniform(DAY_SECONDS, 60 * DAY_SECONDS))
+                for card_id, subject, topic, subtopic, i in cards
+            ),
+        )
+        conn.executemany(
+            "INSERT INTO card_reviews (username, card_id, reviewed_at, grade) VALUES (?, ?, ?, ?)",
+            ((username, rng.choice(cards)[0], now - rng.uniform(0, 365 * DAY_SECONDS), rng.choice((1, 4, 5))) for _ in range(reviews)),
+        )
+
+
+def most_overdue(username):
+    with closing(sqlite3.connect(Path(".user_data") / "users.db")) as conn:
+        return conn.execute(
+            "SELECT subtopic, card_index FROM card_schedule WHERE username = ? ORDER BY due_at LIMIT 1", (username,)
+        ).fetchone()
+
+
+def review_loop(at, picks, metrics_file, totals):
+    """Opens and grades the next due card picks times. Returns click latencies, span means (ms) and new span totals."""
+    clicks = []
+    for _ in range(picks):
+        expected = most_overdue("student0")
+        started = time.perf_counter()
+        next(button for button in at.button if button.label == "Review Next Due Card").click().run()
+        clicks.append(time.perf_counter() - started)
+        if at.exception or (at.session_state["current_subtopic"], at.session_state["flashcard_index"]) != expected:
+            raise RuntimeError(f"Review Next Due Card didn't open {expected}")
+        at.button(key="fc_flip").click().run()
+        at.button(key="fc_grade_4").click().run()
+    time.sleep(METRICS_EXPORT_WAIT_SECONDS)
+    at.run()
+    means, new_totals = {}, {}
+    for span in ("get_due_flashcards", "count_due_flashcards"):
+        total, count = read_span(metrics_file, span)
+        old_total, old_count = totals.get(span, (0.0, 0))
+        means[span] = (total - old_total) / max(1, count - old_count) * 1000
+        new_totals[span] = (total, count)
+    return clicks, means, new_totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cards", type=int, default=50000, help="flashcards in the syllabus, all scheduled (at least 5500)")
+    parser.add_argument("--reviews", type=int, default=1000000, help="review records for the student")
+    parser.add_argument("--picks", type=int, default=30, help="next-card picks timed per mode")
+    args = parser.parse_args()
+
+    topics = SUBJECTS * TOPICS
+    deck_size = max(5, args.cards // topics - 5 * (SUBTOPICS - 1))
+    with tempfile.TemporaryDirectory(prefix="study-hub-due-") as work_dir:
+        work_dir = Path(work_dir)
+        content_dir, metrics_file = work_dir / "content", work_dir / "metrics.prom"
+        write_synthetic_content(content_dir, SUBJECTS, TOPICS, SUBTOPICS, deck_size)
+        os.environ.update({
+            "STUDY_HUB_CONTENT_DIR": str(content_dir),
+            "STUDY_HUB_TTS_CACHE_DIR": str(work_dir / "tts"),
+            "STUDY_HUB_METRICS_FILE": str(metrics_file),
+        })
+        os.chdir(work_dir) # .user_data is relative to the working directory
+        seed_users(1)
+        cards = card_ids(content_dir)
+        started = time.perf_counter()
+        seed_history(cards, args.reviews, "student0", random.Random(0))
+        print(f"{len(cards)} cards, {args.reviews} reviews for student0 (seeded in {time.perf_counter() - started:.1f} s)")
+
+        at = logged_in_session()
+        totals = {}
+        for mode in ("due-date index", "no index"):
+            if mode == "no index":
+                with closing(sqlite3.connect(Path(".user_data") / "users.db")) as conn:
+                    conn.execute("DROP INDEX card_schedule_due")
+            clicks, means, totals = review_loop(at, args.picks, metrics_file, totals)
+            print(
+                f"{mode:15s} click p50 {percentile(clicks, 0.50) * 1000:7.1f} ms  p95 {percentile(clicks, 0.95) * 1000:7.1f} ms  "
+                f"get_due_flashcards {means['get_due_flashcards']:7.2f} ms  count_due_flashcards {means['count_due_flashcards']:7.2f} ms"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""Benchmark for drawing mixed review decks from a large syllabus.
+
+Writes a synthetic syllabus of about 100k flashcards and seeds a review history
+for one student, so "Focus on cards I often miss" has miss rates to weigh. It
+then starts mixed reviews through AppTest: across all subjects, within one
+subject, and weighted by miss rate. For each scenario it reports the latency of
+the whole Start click and the in-app draw time alone, read from the
+draw_review_cards span in the Prometheus metrics export. The first draw also
+builds the card index.
+
+Usage:
+    python benchmarks/bench_mixed_review.py --iterations 30
+"""
+import argparse
+import hashlib
+import json
+import os
+import random
+import sqlite3
+import tempfile
+import time
+from contextlib import closing
+from pathlib import Path
+
+from bench_study_hub import exported_span, logged_in_session, percentile, seed_users, write_synthetic_content
+
+
+def seed_reviews(content_dir, username, count, seed=0):
+    """Inserts count random graded reviews of random cards. Card ids follow the app's flashcard_id()."""
+    rng = random.Random(seed)
+    manifest = json.loads((content_dir / "manifest.json").read_text(encoding="utf-8"))
+    card_ids = []
+    for subject, entry in manifest.items():
+        pack = json.loads((content_dir / entry["pack"]).read_text(encoding="utf-8"))
+        for topic, subtopics in pack.items():
+            for subtopic, body in subtopics.items():
+                for card in body["flashcards"]:
+                    card_ids.append(hashlib.sha256(json.dumps([subject, topic, subtopic, card["q"]]).encode("utf-8")).hexdigest()[:16])
+    reviews = [(username, rng.choice(card_ids), time.time(), rng.choice((1, 4, 5))) for _ in range(count)]
+    with closing(sqlite3.connect(Path(".user_data") / "users.db")) as conn, conn:
+        conn.executemany("INSERT INTO card_reviews (username, card_id, reviewed_at, grade) VALUES (?, ?, ?, ?)", reviews)
+    return len(card_ids)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=30)
+    parser.add_argument("--subjects", type=int, default=5)
+    parser.add_argument("--topics", type=int, default=20)
+    parser.add_argument("--cards-per-topic", type=int, default=1000, help="flashcards in each topic's first subtopic")
+    parser.add_argument("--reviews", type=int, default=20000, help="past reviews seeded for the student")
+    parser.add_argument("--deck", type=int, default=50, help="cards per mixed review")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="study-hub-review-") as work_dir:
+        work_dir = Path(work_dir)
+        content_dir = work_dir / "content"
+        write_synthetic_content(content_dir, args.subjects, args.topics, 5, args.cards_per_topic)
+        metrics_file = work_dir / "metrics.prom"
+        os.environ["STUDY_HUB_CONTENT_DIR"] = str(content_dir)
+        os.environ["STUDY_HUB_METRICS_FILE"] = str(metrics_file)
+        os.chdir(work_dir) # .user_data is relative to the working directory
+        seed_users(1)
+        cards = seed_reviews(content_dir, "student0", args.reviews)
+        print(f"{cards} cards, {args.reviews} past reviews, {args.deck}-card decks")
+
+        at = logged_in_session("student0")
+        at.default_timeout = 600
+        at.number_input(key="review_size").set_value(args.deck).run()
+        started = time.perf_counter()
+        at.button(key="start_review").click().run()
+        print(f"{'first draw (builds index)':28s} {(time.perf_counter() - started) * 1000:8.1f} ms")
+        span_sum, span_count = exported_span(at, metrics_file, "draw_review_cards")
+
+        scenarios = {
+            "all subjects": lambda at: None,
+            "one subject": lambda at: at.multiselect(key="review_subjects").select("Subject 0"),
+            "weighted by miss rate": lambda at: at.checkbox(key="review_weak_first").check(),
+        }
+        for name, configure in scenarios.items():
+            configure(at)
+            at.run()
+            latencies = []
+            for _ in range(args.iterations):
+                at.button(key="end_review").click().run()
+                started = time.perf_counter()
+                at.button(key="start_review").click().run()
+                latencies.append(time.perf_counter() - started)
+                if at.exception:
+                    raise RuntimeError(f"App raised during benchmark: {at.exception[0].value}")
+                if len(at.session_state["review_deck"]) != min(args.deck, cards):
+                    raise RuntimeError("Drew the wrong number of cards")
+            new_sum, new_count = exported_span(at, metrics_file, "draw_review_cards")
+            draw_ms = (new_sum - span_sum) / max(1, new_count - span_count) * 1000
+            span_sum, span_count = new_sum, new_count
+            print(
+                f"{name:28s} click p50 {percentile(latencies, 0.50) * 1000:8.1f} ms  "
+                f"p95 {percentile(latencies, 0.95) * 1000:8.1f} ms  draw mean {draw_ms:7.2f} ms"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""Benchmark for sidebar search latency on a large synthetic syllabus.
+
+Writes a synthetic syllabus (10 subjects x 50 topics x 20 subtopics = 10k
+subtopics by default), logs in through AppTest and types queries into the search
+box. Each query is rerun a number of times. The in-app search_syllabus time
+comes from the Prometheus metrics export; the first query also builds the
+index. The queries range from a word in a few hundred titles to prefixes that
+match every subtopic. For comparison, the benchmark also times a scan over every
+detail, notes and flashcard string for the same words, which is what a search
+would do without the index.
+
+Usage:
+    python benchmarks/bench_search.py --queries "topic 45" remem --repeats 20
+"""
+import argparse
+import json
+import os
+import re
+import tempfile
+import time
+from pathlib import Path
+
+from bench_study_hub import METRICS_EXPORT_WAIT_SECONDS, logged_in_session, percentile, read_span, seed_users, write_synthetic_content
+
+# "45" is only in topic 45's titles (200 subtopics); the other words are in every subtopic
+DEFAULT_QUERIES = ["45", "topic 45", "question 4", "remember fact", "remem", "sentence", "s"]
+
+
+def search_span(at, metrics_file, previous):
+    """Waits for the next export and returns the mean search_syllabus ms since previous (sum, count), and the new totals."""
+    time.sleep(METRICS_EXPORT_WAIT_SECONDS)
+    at.text_input(key="search_query").input("").run() # Triggers the export without searching again
+    total, count = read_span(metrics_file, "search_syllabus")
+    return (total - previous[0]) / max(1, count - previous[1]) * 1000, (total, count)
+
+
+def scan_texts(content_dir):
+    """Every searchable string per subtopic, lower-cased, as a search without the index would walk them."""
+    manifest = json.loads((content_dir / "manifest.json").read_text(encoding="utf-8"))
+    texts = []
+    for subject, entry in manifest.items():
+        pack = json.loads((content_dir / entry["pack"]).read_text(encoding="utf-8"))
+        for topic, subtopics in pack.items():
+            for subtopic, body in subtopics.items():
+                cards = " ".join(f"{card['q']} {card['a']}" for card in body["flashcards"])
+                texts.append(f"{subject} {topic} {subtopic} {body['detail']} {body['notes']} {cards}".lower())
+    return texts
+
+
+def scan(texts, query):
+    """Subtopics whose text contains every query word as a word prefix."""
+    patterns = [re.compile(rf"\b{re.escape(word)}") for word in re.findall(r"\w+", query.lower())]
+    return [text for text in texts if all(pattern.search(text) for pattern in patterns)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--subjects", type=int, default=10)
+    parser.add_argument("--topics", type=int, default=50, help="topics per subject")
+    parser.add_argument("--subtopics", type=int, default=20, help="subtopics per topic")
+    parser.add_argument("--queries", nargs="+", default=DEFAULT_QUERIES)
+    parser.add_argument("--repeats", type=int, default=20, help="reruns timed per query")
+    parser.add_argument("--scans", type=int, default=3, help="unindexed scans timed per query (0 to skip)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="study-hub-search-") as work_dir:
+        work_dir = Path(work_dir)
+        content_dir, metrics_file = work_dir / "content", work_dir / "metrics.prom"
+        write_synthetic_content(content_dir, args.subjects, args.topics, args.subtopics, 5)
+        os.environ.update({
+            "STUDY_HUB_CONTENT_DIR": str(content_dir),
+            "STUDY_HUB_TTS_CACHE_DIR": str(work_dir / "tts"),
+            "STUDY_HUB_METRICS_FILE": str(metrics_file),
+        })
+        os.chdir(work_dir) # .user_data is relative to the working directory
+        seed_users(1)
+        at = logged_in_session()
+        texts = scan_texts(content_dir) if args.scans else []
+
+        print(f"{args.subjects * args.topics * args.subtopics} subtopics ({args.subjects}x{args.topics}x{args.subtopics})")
+        started = time.perf_counter()
+        at.text_input(key="search_query").input("index").run() # Builds the index
+        build_wall = time.perf_counter() - started
+        build_ms, totals = search_span(at, metrics_file, (0.0, 0))
+        print(f"{'(index build)':18s} search {build_ms:9.2f} ms  rerun {build_wall * 1000:8.1f} ms")
+
+        for query in args.queries:
+            at.text_input(key="search_query").input(query).run()
+            results = sum(1 for button in at.button if (button.key or "").startswith("search_result_"))
+            walls = []
+            for _ in range(args.repeats):
+                started = time.perf_counter()
+                at.run()
+                walls.append(time.perf_counter() - started)
+            if at.exception:
+                raise RuntimeError(f"App raised on query {query!r}: {at.exception[0].value}")
+            search_ms, totals = search_span(at, metrics_file, totals)
+            line = (
+                f"{query!r:18s} search {search_ms:9.2f} ms  "
+                f"rerun p50 {percentile(walls, 0.50) * 1000:7.1f} ms  p95 {percentile(walls, 0.95) * 1000:7.1f} ms  "
+                f"{results:2d} results"
+            )
+            if args.scans:
+                started = time.perf_counter()
+                for _ in range(args.scans):
+                    matches = len(scan(texts, query))
+                line += f"  scan {(time.perf_counter() - started) / args.scans * 1000:8.1f} ms ({matches} matches)"
+            print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,334 @@
+"""Benchmarks for the Study Hub script paths, driven by Streamlit's AppTest harness.
+
+Runs login, navigation, flashcard paging and both Read Aloud buttons against a
+throwaway data directory and synthetic content, with the offline TTS stub and
+the cheapest bcrypt cost. For each interaction it reports latency percentiles,
+full script runs per interaction and peak traced memory.
+
+With --before REV, the same scenarios also run against REV's copy of the app,
+each app in a fresh process, and the script runs and latency are shown side by
+side. --after REV compares against REV instead of the working tree, so one
+change can be measured on its own. Revisions older than the app's script_runs
+counter get one added at the top of their script.
+
+Usage:
+    python benchmarks/bench_study_hub.py                     # run and print
+    python benchmarks/bench_study_hub.py --save main         # also write baselines/main.json
+    python benchmarks/bench_study_hub.py --compare main      # flag regressions against it
+    python benchmarks/bench_study_hub.py --before 69675de~1 --after 69675de  # before/after rerun-free navigation
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import re
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+import bcrypt
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+APP_PATH = REPO_DIR / "code (3).py"
+BASELINE_DIR = Path(__file__).resolve().parent / "baselines"
+BENCH_PASSWORD = "benchpass"
+PEAK_MEMORY_SAMPLES = 5 # Interactions re-run under tracemalloc (it slows everything down)
+REGRESSION_TOLERANCE = 0.20 # Flag metrics more than 20% worse than the baseline
+METRICS_EXPORT_SECONDS = 1 # Export interval the benchmarked app is given, so span reads wait about a second
+METRICS_EXPORT_WAIT_SECONDS = METRICS_EXPORT_SECONDS + 0.5
+SCRIPT_RUN_COUNTER = 'import streamlit as st\nst.session_state.script_runs = st.session_state.get("script_runs", 0) + 1\n'
+
+# Offline backends: stub TTS, the minimum bcrypt cost and a short metrics export interval, set before the app is imported
+os.environ.setdefault("STUDY_HUB_TTS_BACKEND", "stub")
+os.environ.setdefault("STUDY_HUB_BCRYPT_ROUNDS", "4")
+os.environ.setdefault("STUDY_HUB_METRICS_EXPORT_SECONDS", str(METRICS_EXPORT_SECONDS))
+
+from streamlit.testing.v1 import AppTest  # noqa: E402
+
+
+def write_synthetic_content(content_dir, subjects, topics, subtopics, deck_size):
+    """Writes a manifest and subject packs. The first subtopic of each topic gets the large deck."""
+    content_dir.mkdir(parents=True, exist_ok=True)
+    manifest = {}
+    for s in range(subjects):
+        subject = f"Subject {s}"
+        pack = {}
+        for t in range(topics):
+            topic = f"Topic {s}.{t}"
+            pack[topic] = {}
+            for u in range(subtopics):
+                deck = deck_size if u == 0 else 5
+                pack[topic][f"Subtopic {s}.{t}.{u}"] = {
+                    "detail": "**Introduction:**\n" + " ".join(
+                        f"Sentence {i} about subtopic {s}.{t}.{u} and its key ideas." for i in range(40)
+                    ),
+                    "notes": "\n".join(f"*   **Point {i}:** remember fact {i}." for i in range(10)),
+                    "flashcards": [{"q": f"Question {i} of {s}.{t}.{u}?", "a": f"Answer {i}"} for i in range(deck)],
+                }
+        manifest[subject] = {"pack": f"subject_{s}.json", "topics": {topic: list(body) for topic, body in pack.items()}}
+        (content_dir / f"subject_{s}.json").write_text(json.dumps(pack), encoding="utf-8")
+    (content_dir / "manifest.json").write_text(json.dumps(manifest), encoding="utf-8")
+
+
+def seed_users(count):
+    """Creates the user store through the app, then bulk-inserts count users sharing one hash."""
+    AppTest.from_file(str(APP_PATH), default_timeout=60).run()
+    hashed = bcrypt.hashpw(BENCH_PASSWORD.encode("utf-8"), bcrypt.gensalt(rounds=4)).decode("utf-8")
+    with sqlite3.connect(Path(".user_data") / "users.db") as conn:
+        conn.executemany(
+            "INSERT OR IGNORE INTO users (username, hashed_password) VALUES (?, ?)",
+            ((f"student{i}", hashed) for i in range(count)),
+        )
+
+
+def new_session():
+    """Returns a fresh AppTest session on the login page."""
+    at = AppTest.from_file(str(APP_PATH), default_timeout=60)
+    at.run()
+    return at
+
+
+def logged_in_session(username="student0"):
+    """Returns an AppTest session that has logged in and rendered the main page."""
+    at = new_session()
+    at.text_input(key="login_user").input(username)
+    at.text_input(key="login_pass").input(BENCH_PASSWORD)
+    at.button[0].click().run()
+    return at
+
+
+def read_span(metrics_file, name):
+    """Returns (sum, count) of a span from the Prometheus export."""
+    text = metrics_file.read_text(encoding="utf-8") if metrics_file.exists() else ""
+    total = re.search(rf'study_hub_span_seconds_sum{{span="{name}"}} (\S+)', text)
+    count = re.search(rf'study_hub_span_seconds_count{{span="{name}"}} (\S+)', text)
+    return (float(total.group(1)), int(count.group(1))) if total and count else (0.0, 0)
+
+
+def exported_span(at, metrics_file, name):
+    """Waits for the next metrics export, reruns so the app writes it, then reads the span."""
+    time.sleep(METRICS_EXPORT_WAIT_SECONDS)
+    at.run()
+    return read_span(metrics_file, name)
+
+
+def script_runs(at):
+    return at.session_state["script_runs"] if "script_runs" in at.session_state else 0
+
+
+def timed_interaction(at, action):
+    """Applies action to the session and runs the script. Returns (seconds, script runs)."""
+    runs_before = script_runs(at)
+    started = time.perf_counter()
+    action(at).run()
+    elapsed = time.perf_counter() - started
+    if at.exception:
+        raise RuntimeError(f"App raised during benchmark: {at.exception[0].value}")
+    return elapsed, script_runs(at) - runs_before
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def run_scenario(setup, steps, iterations, reset=None):
+    """Times iterations of steps (action functions, cycled) on the session from setup.
+
+    reset, if given, runs untimed before every step.
+    """
+    at = setup()
+    latencies, runs = [], []
+    for i in range(iterations):
+        if reset:
+            reset(at)
+        elapsed, run_count = timed_interaction(at, steps[i % len(steps)])
+        latencies.append(elapsed)
+        runs.append(run_count)
+    # Peak memory on a separate, shorter pass so tracing doesn't skew the timings
+    at = setup()
+    tracemalloc.start()
+    try:
+        for i in range(min(iterations, PEAK_MEMORY_SAMPLES)):
+            if reset:
+                reset(at)
+            timed_interaction(at, steps[i % len(steps)])
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {
+        "iterations": iterations,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p95_ms": percentile(latencies, 0.95) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "mean_ms": sum(latencies) / len(latencies) * 1000,
+        "script_runs_per_interaction": sum(runs) / len(runs),
+        "peak_kib": peak / 1024,
+    }
+
+
+def login_step(at):
+    at.text_input(key="login_user").input("student0")
+    at.text_input(key="login_pass").input(BENCH_PASSWORD)
+    return at.button[0].click()
+
+
+def reset_to_login(at):
+    """Puts a session back on the login page so the next step is a real login."""
+    at.session_state["logged_in"] = False
+    at.session_state["username"] = None
+    at.run()
+
+
+def scenarios():
+    """Maps scenario name -> (setup, steps, untimed reset before each step)."""
+    return {
+        "login": (new_session, [login_step], reset_to_login),
+        "navigate_subject": (logged_in_session, [
+            lambda at: at.radio(key="subject_selector").set_value("Subject 1"),
+            lambda at: at.radio(key="subject_selector").set_value("Subject 0"),
+        ], None),
+        "navigate_topic": (logged_in_session, [
+            lambda at: at.selectbox(key="topic_selector").set_value("Topic 0.1"),
+            lambda at: at.selectbox(key="topic_selector").set_value("Topic 0.0"),
+        ], None),
+        "navigate_subtopic": (logged_in_session, [
+            lambda at: at.radio(key="subtopic_selector").set_value("Subtopic 0.0.1"),
+            lambda at: at.radio(key="subtopic_selector").set_value("Subtopic 0.0.0"),
+        ], None),
+        "flashcard_page": (logged_in_session, [
+            lambda at: at.button(key="fc_next").click(),
+            lambda at: at.button(key="fc_prev").click(),
+        ], None),
+        "flashcard_flip": (logged_in_session, [lambda at: at.button(key="fc_flip").click()], None),
+        "read_explanation_aloud": (logged_in_session, [lambda at: at.button(key="tts_detail").click()], None),
+        "read_notes_aloud": (logged_in_session, [lambda at: at.button(key="tts_notes").click()], None),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def write_revision_app(revision, work_dir):
+    """Writes revision's app into work_dir, beside work_dir/content (where older revisions look for it)."""
+    source = subprocess.run(
+        ["git", "show", f"{revision}:{APP_PATH.name}"], cwd=REPO_DIR, capture_output=True, text=True, check=True
+    ).stdout
+    if "script_runs" not in source:
+        source = SCRIPT_RUN_COUNTER + source
+    app_path = work_dir / APP_PATH.name
+    app_path.write_text(source, encoding="utf-8")
+    return app_path
+
+
+def run_suite(args, revision=None):
+    """Runs the selected scenarios against the working tree's app, or revision's. Returns the results."""
+    global APP_PATH
+    with tempfile.TemporaryDirectory(prefix="study-hub-bench-") as work_dir:
+        work_dir = Path(work_dir)
+        write_synthetic_content(work_dir / "content", args.subjects, args.topics, args.subtopics, args.deck_size)
+        os.environ["STUDY_HUB_CONTENT_DIR"] = str(work_dir / "content")
+        os.environ["STUDY_HUB_TTS_CACHE_DIR"] = str(work_dir / "tts") # Keep stub clips out of the checkout's static/tts
+        if revision:
+            APP_PATH = write_revision_app(revision, work_dir) # Every session this process starts runs it
+        os.chdir(work_dir) # .user_data is relative to the working directory
+        seed_users(args.users)
+
+        results = {
+            "meta": {
+                "commit": revision or git_commit(),
+                "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "python": platform.python_version(),
+                "users": args.users,
+                "deck_size": args.deck_size,
+                "subtopics": args.subjects * args.topics * args.subtopics,
+            },
+            "scenarios": {},
+        }
+        for name, (setup, steps, reset) in scenarios().items():
+            if args.only and name not in args.only:
+                continue
+            results["scenarios"][name] = run_scenario(setup, steps, args.iterations, reset)
+    return results
+
+
+def print_results(results):
+    for name, metrics in results["scenarios"].items():
+        print(
+            f"{name:24s} p50 {metrics['p50_ms']:8.1f} ms  p95 {metrics['p95_ms']:8.1f} ms  "
+            f"p99 {metrics['p99_ms']:8.1f} ms  runs/interaction {metrics['script_runs_per_interaction']:.2f}  "
+            f"peak {metrics['peak_kib']:9.1f} KiB"
+        )
+
+
+def compare(results, baseline):
+    """Prints metrics that regressed past REGRESSION_TOLERANCE. Returns the number of regressions."""
+    regressions = 0
+    for name, metrics in results["scenarios"].items():
+        old = baseline["scenarios"].get(name)
+        if old is None:
+            continue
+        for metric in ("p50_ms", "p95_ms", "script_runs_per_interaction", "peak_kib"):
+            if old[metric] and metrics[metric] > old[metric] * (1 + REGRESSION_TOLERANCE):
+                regressions += 1
+                print(f"REGRESSION {name}.{metric}: {old[metric]:.2f} -> {metrics[metric]:.2f}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=30)
+    parser.add_argument("--users", type=int, default=1000, help="users in the store for the login benchmark")
+    parser.add_argument("--deck-size", type=int, default=1000, help="flashcards in the paged deck")
+    parser.add_argument("--subjects", type=int, default=3)
+    parser.add_argument("--topics", type=int, default=5)
+    parser.add_argument("--subtopics", type=int, default=20)
+    parser.add_argument("--only", nargs="*", help="scenario names to run (default: all)")
+    parser.add_argument("--save", metavar="NAME", help="write results to baselines/NAME.json")
+    parser.add_argument("--compare", metavar="NAME", help="compare results with baselines/NAME.json")
+    parser.add_argument("--before", metavar="REV", help="also run REV's app and show before/after side by side")
+    parser.add_argument("--after", metavar="REV", help="with --before, the revision to compare (default: working tree)")
+    args = parser.parse_args()
+    if args.after and not args.before:
+        parser.error("--after needs --before")
+
+    if args.before:
+        # One fresh process per app, one at a time: cache_resource state is process-wide
+        with multiprocessing.get_context("spawn").Pool(1, maxtasksperchild=1) as pool:
+            before, results = pool.starmap(run_suite, [(args, args.before), (args, args.after)])
+        print(f"before ({args.before})")
+        print_results(before)
+        print(f"after ({results['meta']['commit']})")
+        print_results(results)
+        for name, metrics in results["scenarios"].items():
+            old = before["scenarios"][name]
+            print(
+                f"{name:24s} runs/interaction {old['script_runs_per_interaction']:.2f} -> {metrics['script_runs_per_interaction']:.2f}  "
+                f"p50 {old['p50_ms']:8.1f} -> {metrics['p50_ms']:8.1f} ms"
+            )
+    else:
+        results = run_suite(args)
+        print_results(results)
+
+    if args.save:
+        BASELINE_DIR.mkdir(exist_ok=True)
+        (BASELINE_DIR / f"{args.save}.json").write_text(json.dumps(results, indent=2) + "\n", encoding="utf-8")
+    if args.compare:
+        baseline = json.loads((BASELINE_DIR / f"{args.compare}.json").read_text(encoding="utf-8"))
+        if compare(results, baseline):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
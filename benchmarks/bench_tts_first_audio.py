@@ -0,0 +1,85 @@
+"""Benchmark for Read Aloud time-to-first-audio, chunked pipeline against single-shot synthesis.
+
+Clicks "Read Explanation Aloud" on a series of synthetic subtopics, each a
+different text, and waits for each job to finish. The stub TTS backend sleeps a
+fixed time per request plus a time per character, roughly like gTTS, whose
+requests grow with the text. The single-shot run sets STUDY_HUB_TTS_CHUNK_CHARS
+so high that every text is one chunk, which is how the app synthesized before
+chunking: playback could only start once the whole text was done. Each mode runs
+in a fresh process. Times come from the app's own spans in the Prometheus
+export: tts_first_audio (click until part 1, which the player starts on, is
+stored) and generate_tts_audio (click until the last part is stored).
+
+Usage:
+    python benchmarks/bench_tts_first_audio.py --texts 10 --request-delay 0.2 --char-delay 0.004
+"""
+import argparse
+import multiprocessing
+import os
+import tempfile
+import time
+from pathlib import Path
+
+SINGLE_SHOT_CHUNK_CHARS = 10 ** 9
+JOB_TIMEOUT_SECONDS = 600
+
+
+def measure_mode(chunk_chars, texts, request_delay, char_delay):
+    """Worker: reads texts aloud one after another with the given chunk size. Returns mean times in seconds."""
+    with tempfile.TemporaryDirectory(prefix="study-hub-first-audio-") as work_dir:
+        work_dir = Path(work_dir)
+        os.environ.update({
+            "STUDY_HUB_TTS_BACKEND": "stub",
+            "STUDY_HUB_BCRYPT_ROUNDS": "4",
+            "STUDY_HUB_TTS_STUB_DELAY": str(request_delay),
+            "STUDY_HUB_TTS_STUB_CHAR_DELAY": str(char_delay),
+            "STUDY_HUB_TTS_CHUNK_CHARS": str(chunk_chars),
+            "STUDY_HUB_CONTENT_DIR": str(work_dir / "content"),
+            "STUDY_HUB_TTS_CACHE_DIR": str(work_dir / "tts"),
+            "STUDY_HUB_METRICS_FILE": str(work_dir / "metrics.prom"),
+        })
+        from bench_study_hub import exported_span, logged_in_session, read_span, seed_users, write_synthetic_content
+
+        write_synthetic_content(work_dir / "content", 1, 1, texts, 5)
+        os.chdir(work_dir) # .user_data is relative to the working directory
+        seed_users(1)
+        at = logged_in_session()
+        for i in range(texts):
+            at.radio(key="subtopic_selector").set_value(f"Subtopic 0.0.{i}").run()
+            at.button(key="tts_detail").click().run()
+            started = time.perf_counter()
+            while at.get("progress") or not at.get("audio"):
+                if at.exception or at.error or time.perf_counter() - started > JOB_TIMEOUT_SECONDS:
+                    raise RuntimeError(f"Read Aloud didn't finish for subtopic {i}")
+                time.sleep(0.05)
+                at.run()
+        first_sum, first_count = exported_span(at, work_dir / "metrics.prom", "tts_first_audio")
+        total_sum, total_count = read_span(work_dir / "metrics.prom", "generate_tts_audio")
+        return {"first_audio_s": first_sum / first_count, "total_s": total_sum / total_count, "jobs": total_count}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--texts", type=int, default=10, help="distinct explanations read aloud per mode")
+    parser.add_argument("--request-delay", type=float, default=0.2, help="stub seconds per synthesis request")
+    parser.add_argument("--char-delay", type=float, default=0.004, help="stub seconds per character synthesized")
+    parser.add_argument("--chunk-chars", type=int, default=400, help="chunk size of the chunked pipeline")
+    args = parser.parse_args()
+
+    modes = {"single-shot": SINGLE_SHOT_CHUNK_CHARS, "chunked": args.chunk_chars}
+    # One fresh process per mode, one at a time, so jobs, clips and metrics aren't shared
+    with multiprocessing.get_context("spawn").Pool(1, maxtasksperchild=1) as pool:
+        results = dict(zip(modes, pool.starmap(
+            measure_mode, [(chunk_chars, args.texts, args.request_delay, args.char_delay) for chunk_chars in modes.values()]
+        )))
+
+    print(f"{args.texts} texts, stub {args.request_delay:.2f} s/request + {args.char_delay * 1000:.1f} ms/char")
+    for name, result in results.items():
+        print(
+            f"{name:12s} first audio {result['first_audio_s']:6.2f} s  "
+            f"whole text {result['total_s']:6.2f} s  ({result['jobs']} jobs)"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""Benchmark for login lookups as the number of registered students grows.
+
+Grows one SQLite user store from 10 to 100k users and, at each size, logs in
+through AppTest as random existing students. It reports the in-app
+load_user_data time, read from the Prometheus metrics export, and the latency
+of the whole Login click. For comparison it also times the lookup the app did
+before the store. That lookup globbed .user_data/*.json and parsed every
+per-user file, so it grows with the number of users.
+
+Usage:
+    python benchmarks/bench_user_store.py --sizes 10 100 1000 10000 100000 --logins 30
+"""
+import argparse
+import hashlib
+import json
+import os
+import random
+import tempfile
+import time
+from pathlib import Path
+
+from bench_study_hub import BENCH_PASSWORD, exported_span, new_session, percentile, reset_to_login, seed_users
+
+
+def write_legacy_files(legacy_dir, start, stop, hashed):
+    """Writes users start..stop-1 as the old <sha256[:16]>.json files."""
+    for i in range(start, stop):
+        username = f"student{i}"
+        name = hashlib.sha256(username.encode()).hexdigest()[:16]
+        (legacy_dir / f"{name}.json").write_text(json.dumps({"username": username, "hashed_password": hashed}))
+
+
+def legacy_lookup(legacy_dir, username):
+    """The pre-store lookup: parse every user file into a dict, then pick one user."""
+    users = {}
+    for user_file in legacy_dir.glob("*.json"):
+        with open(user_file, 'r') as f:
+            data = json.load(f)
+            if "username" in data and "hashed_password" in data:
+                users[data["username"]] = data["hashed_password"]
+    return users.get(username)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000, 10000, 100000])
+    parser.add_argument("--logins", type=int, default=30, help="logins timed at each size")
+    parser.add_argument("--legacy-lookups", type=int, default=3, help="file-scan lookups timed at each size (0 to skip)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="study-hub-users-") as work_dir:
+        work_dir = Path(work_dir)
+        metrics_file = work_dir / "metrics.prom"
+        legacy_dir = work_dir / "legacy"
+        legacy_dir.mkdir()
+        os.environ["STUDY_HUB_METRICS_FILE"] = str(metrics_file)
+        os.chdir(work_dir) # .user_data is relative to the working directory
+        rng = random.Random(0)
+        at = new_session()
+        span_sum, span_count = 0.0, 0
+        legacy_users = 0
+        for size in sorted(args.sizes):
+            seed_users(size) # Adds student0..size-1 to the store, keeping the ones already there
+            latencies = []
+            for _ in range(args.logins):
+                reset_to_login(at)
+                at.text_input(key="login_user").input(f"student{rng.randrange(size)}")
+                at.text_input(key="login_pass").input(BENCH_PASSWORD)
+                started = time.perf_counter()
+                at.button[0].click().run()
+                latencies.append(time.perf_counter() - started)
+                if at.exception or not at.session_state["logged_in"]:
+                    raise RuntimeError(f"Login failed for {at.session_state['login_user']}")
+            new_sum, new_count = exported_span(at, metrics_file, "load_user_data")
+            lookup_ms = (new_sum - span_sum) / max(1, new_count - span_count) * 1000
+            span_sum, span_count = new_sum, new_count
+
+            line = (
+                f"{size:7d} users  load_user_data {lookup_ms:7.3f} ms  "
+                f"login p50 {percentile(latencies, 0.50) * 1000:7.1f} ms  p95 {percentile(latencies, 0.95) * 1000:7.1f} ms"
+            )
+            if args.legacy_lookups:
+                write_legacy_files(legacy_dir, legacy_users, size, "$2b$04$placeholder")
+                legacy_users = size
+                started = time.perf_counter()
+                for _ in range(args.legacy_lookups):
+                    legacy_lookup(legacy_dir, f"student{rng.randrange(size)}")
+                line += f"  file scan {(time.perf_counter() - started) / args.legacy_lookups * 1000:9.1f} ms"
+            print(line)
+
+
+if __name__ == "__main__":
+    main()
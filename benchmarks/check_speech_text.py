@@ -0,0 +1,67 @@
+"""Regression check for the speech text Read Aloud sends to the TTS engine.
+
+Opens the authored Quadratic Equations subtopic from content/ through AppTest and
+clicks both Read Aloud buttons with the stub backend. The stub stores each clip
+as "en|False|<chunk>", so the clips hold exactly the text the engine was given.
+The check fails if markdown emphasis is still in that text, or if stripping it
+ate the formula's multiplication signs (which the engine would read as
+"forty-two").
+
+Usage:
+    python benchmarks/check_speech_text.py
+"""
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from bench_study_hub import logged_in_session, seed_users
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+STUB_PREFIX = "en|False|"
+SUBJECT, TOPIC, SUBTOPIC = "Mathematics", "Algebra", "Quadratic Equations"
+MUST_KEEP = ("4*2*(-1)", "(2*2)", "2*sqrt(6)", "sqrt(b² - 4ac)")
+MUST_DROP = ("**", "`")
+JOB_WAIT_POLLS = 300
+
+
+def main():
+    with tempfile.TemporaryDirectory(prefix="study-hub-speech-") as work_dir:
+        work_dir = Path(work_dir)
+        os.environ["STUDY_HUB_CONTENT_DIR"] = str(REPO_DIR / "content")
+        os.environ["STUDY_HUB_TTS_CACHE_DIR"] = str(work_dir / "tts")
+        os.chdir(work_dir) # .user_data is relative to the working directory
+        seed_users(1)
+
+        at = logged_in_session()
+        at.radio(key="subject_selector").set_value(SUBJECT).run()
+        at.selectbox(key="topic_selector").set_value(TOPIC).run()
+        at.radio(key="subtopic_selector").set_value(SUBTOPIC).run()
+        for key in ("tts_detail", "tts_notes"):
+            at.button(key=key).click().run()
+        # Poll like the status fragment would until both jobs are done
+        for _ in range(JOB_WAIT_POLLS):
+            if at.exception:
+                raise RuntimeError(f"App raised on Read Aloud: {at.exception[0].value}")
+            if not at.get("progress") and len(at.get("audio")) >= 2:
+                break
+            time.sleep(0.1)
+            at.run()
+        else:
+            raise RuntimeError("Read Aloud jobs didn't finish")
+        speech = "\n".join(
+            clip.read_text(encoding="utf-8").removeprefix(STUB_PREFIX) for clip in sorted((work_dir / "tts").glob("*.mp3"))
+        )
+
+    failures = [f"lost {text!r}" for text in MUST_KEEP if text not in speech]
+    failures += [f"still contains {text!r}" for text in MUST_DROP if text in speech]
+    print(f"{len(speech)} chars of speech text for {SUBJECT} › {TOPIC} › {SUBTOPIC}")
+    for failure in failures:
+        print(f"FAIL {failure}")
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""Offline checks for the TTS clip store, using the stub backend.
+
+Drives Read Aloud through AppTest on synthetic content and checks three things.
+Key composition: every stored clip is named by the sha256 of
+[text, lang, slow, backend]; the stub writes "lang|slow|text" into each clip, so
+the name can be recomputed from the clip's content. Hit/miss counters: the first
+read of a text misses once per chunk, and reading it again after the job was
+released hits once per chunk, as exported to the Prometheus file. Eviction:
+with STUDY_HUB_TTS_CACHE_MAX_BYTES set to about one and a half texts' worth of
+clips, reading more texts keeps the store under the cap. The newest text's
+clips stay and the oldest ones go.
+
+Usage:
+    python benchmarks/check_tts_cache.py
+"""
+import hashlib
+import json
+import os
+import re
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from bench_study_hub import METRICS_EXPORT_WAIT_SECONDS, logged_in_session, seed_users, write_synthetic_content
+
+BACKEND = "stub"
+JOB_WAIT_POLLS = 300
+
+
+def wait_for_audio(at):
+    """Polls like the status fragment would until the page's Read Aloud job is done."""
+    for _ in range(JOB_WAIT_POLLS):
+        if at.exception:
+            raise RuntimeError(f"App raised on Read Aloud: {at.exception[0].value}")
+        if not at.get("progress") and at.get("audio"):
+            return
+        time.sleep(0.1)
+        at.run()
+    raise RuntimeError("Read Aloud job didn't finish")
+
+
+def read_aloud(at, subtopic):
+    """Opens a subtopic and reads its explanation aloud."""
+    at.radio(key="subtopic_selector").set_value(subtopic).run()
+    at.button(key="tts_detail").click().run()
+    wait_for_audio(at)
+
+
+def clips(cache_dir):
+    """Maps each stored clip's name (its key) to the (lang, slow, text) the stub wrote into it."""
+    return {
+        path.stem: tuple(path.read_text(encoding="utf-8").split("|", 2)) for path in cache_dir.glob("*.mp3")
+    }
+
+
+def lookups(at, metrics_file):
+    """Waits, reruns so the app exports its metrics, and returns the (hits, misses) counters."""
+    time.sleep(METRICS_EXPORT_WAIT_SECONDS)
+    at.run()
+    text = metrics_file.read_text(encoding="utf-8")
+    return tuple(
+        int(re.search(rf'study_hub_tts_cache_lookups_total{{result="{result}"}} (\d+)', text).group(1))
+        for result in ("hits", "misses")
+    )
+
+
+def main():
+    failures = []
+
+    def check(ok, message):
+        print(f"{'ok  ' if ok else 'FAIL'} {message}")
+        if not ok:
+            failures.append(message)
+
+    with tempfile.TemporaryDirectory(prefix="study-hub-tts-check-") as work_dir:
+        work_dir = Path(work_dir)
+        cache_dir, metrics_file = work_dir / "tts", work_dir / "metrics.prom"
+        write_synthetic_content(work_dir / "content", 1, 1, 6, 5)
+        os.environ.update({
+            "STUDY_HUB_TTS_BACKEND": BACKEND,
+            "STUDY_HUB_CONTENT_DIR": str(work_dir / "content"),
+            "STUDY_HUB_TTS_CACHE_DIR": str(cache_dir),
+            "STUDY_HUB_METRICS_FILE": str(metrics_file),
+        })
+        os.chdir(work_dir) # .user_data is relative to the working directory
+        seed_users(1)
+        at = logged_in_session()
+
+        # Key composition
+        read_aloud(at, "Subtopic 0.0.0")
+        first = clips(cache_dir)
+        check(len(first) > 1, f"long explanation stored as {len(first)} chunk clips")
+        expected = {
+            hashlib.sha256(json.dumps([text, lang, slow == "True", BACKEND]).encode("utf-8")).hexdigest()
+            for lang, slow, text in first.values()
+        }
+        check(set(first) == expected, "clip names are sha256 of [text, lang, slow, backend]")
+
+        # Hit/miss counters
+        hits, misses = lookups(at, metrics_file)
+        check((hits, misses) == (0, len(first)), f"first read: {hits} hits, {misses} misses (expected 0, {len(first)})")
+        at.radio(key="subtopic_selector").set_value("Subtopic 0.0.1").run() # Releases the finished job
+        read_aloud(at, "Subtopic 0.0.0")
+        hits, misses = lookups(at, metrics_file)
+        check((hits, misses) == (len(first), len(first)), f"second read: {hits} hits, {misses} misses (expected {len(first)}, {len(first)})")
+        check(clips(cache_dir) == first, "second read synthesized nothing new")
+
+        # Eviction under the size cap
+        cap = sum(path.stat().st_size for path in cache_dir.glob("*.mp3")) * 3 // 2
+        os.environ["STUDY_HUB_TTS_CACHE_MAX_BYTES"] = str(cap)
+        for i in range(2, 6):
+            before = set(clips(cache_dir))
+            read_aloud(at, f"Subtopic 0.0.{i}")
+            stored = clips(cache_dir)
+            newest = set(stored) - before
+            total = sum(path.stat().st_size for path in cache_dir.glob("*.mp3"))
+            check(total <= cap, f"after text {i}: store is {total} bytes, cap {cap}")
+            ours = [key for key in newest if f"subtopic 0.0.{i} " in stored[key][2]]
+            check(len(ours) == len(newest) == len(first), f"after text {i}: all {len(ours)} of its clips are kept")
+        check(not set(first) & set(clips(cache_dir)), "the oldest text's clips were evicted")
+
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
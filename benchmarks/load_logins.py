@@ -0,0 +1,167 @@
+"""Load test for logins at increasing concurrency.
+
+Starts a real Streamlit server on the app, with a user store whose hashes use
+the configured bcrypt cost. Logins therefore verify at full cost and nothing is
+rehashed. At each concurrency level, that many websocket clients log in over
+and over at once. Each login opens a new session, renders the login page
+(untimed), then submits the form the way a browser does and waits for the
+script run to finish. Every login goes through the one server process and its
+shared bcrypt pool. The script reports logins/sec, p50/p95 login latency and how
+many logins the pool turned away as busy.
+
+Usage:
+    python benchmarks/load_logins.py --concurrency 1 8 32 --logins 10 --rounds 12
+"""
+import asyncio
+import argparse
+import os
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import bcrypt
+import websockets
+from streamlit.proto.BackMsg_pb2 import BackMsg
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+
+from bench_study_hub import APP_PATH, BENCH_PASSWORD, percentile, seed_users
+from measure_tts_delivery import free_port, http_get
+
+
+RESPONSE_TIMEOUT_SECONDS = 120 # A saturated server answers late; it shows up as latency, not an error
+
+
+def start_server(work_dir, env=None):
+    """Starts a headless Streamlit server on the app in work_dir and waits until it's up. Returns (process, base URL)."""
+    port = free_port()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "streamlit", "run", str(APP_PATH), "--server.headless", "true",
+         "--server.port", str(port), "--browser.gatherUsageStats", "false"],
+        cwd=work_dir, env={**os.environ, **(env or {})}, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    base_url = f"http://localhost:{port}/"
+    for _ in range(120):
+        try:
+            http_get(base_url + "_stcore/health")
+            break
+        except OSError:
+            time.sleep(0.25)
+    return server, base_url
+
+
+def connect(base_url):
+    """Opens a websocket session with the server, like a new browser tab."""
+    ws_url = base_url.replace("http://", "ws://") + "_stcore/stream"
+    return websockets.connect(ws_url, max_size=None, open_timeout=RESPONSE_TIMEOUT_SECONDS)
+
+
+async def run_script(ws, base_url, widgets=(), fragment_id="", polled=None):
+    """Sends one script run with the given widget states and waits until it, and any st.rerun() it makes, is done.
+
+    With fragment_id, only that fragment reruns, as when a browser uses a widget inside it or
+    polls it. Returns the new elements as (id of the fragment drawn in, element) pairs. Fragments
+    that ask to be rerun on a timer are added to the polled dict as fragment id -> interval (s).
+    """
+    msg = BackMsg()
+    msg.rerun_script.context_info.url = base_url
+    msg.rerun_script.fragment_id = fragment_id
+    for widget_id, field, value in widgets:
+        state = msg.rerun_script.widget_states.widgets.add()
+        state.id = widget_id
+        setattr(state, field, value)
+    await ws.send(msg.SerializeToString())
+    elements = []
+    while True:
+        forward = ForwardMsg()
+        forward.ParseFromString(await asyncio.wait_for(ws.recv(), RESPONSE_TIMEOUT_SECONDS))
+        kind = forward.WhichOneof("type")
+        if kind == "delta" and forward.delta.WhichOneof("type") == "new_element":
+            elements.append((forward.delta.fragment_id, forward.delta.new_element))
+        elif kind == "auto_rerun" and polled is not None:
+            polled[forward.auto_rerun.fragment_id] = forward.auto_rerun.interval
+        elif kind == "script_finished" and forward.script_finished != ForwardMsg.FINISHED_EARLY_FOR_RERUN:
+            return elements
+
+
+def widget_ids(elements, kinds=("text_input", "button")):
+    """Maps the label of each widget of the given kinds to (widget id, fragment id)."""
+    ids = {}
+    for fragment_id, element in elements:
+        kind = element.WhichOneof("type")
+        if kind in kinds:
+            ids[getattr(element, kind).label] = (getattr(element, kind).id, fragment_id)
+    return ids
+
+
+async def submit_login(ws, base_url, username):
+    """Renders the login page (untimed) and submits the form. Returns (seconds, outcome, the new elements)."""
+    ids = widget_ids(await run_script(ws, base_url))
+    started = time.perf_counter()
+    result = await run_script(ws, base_url, [
+        (ids["Username"][0], "string_value", username),
+        (ids["Password"][0], "string_value", BENCH_PASSWORD),
+        (ids["Login"][0], "trigger_value", True),
+    ])
+    elapsed = time.perf_counter() - started
+    text = "\n".join(str(element) for _, element in result)
+    if f"Welcome, {username}!" in text:
+        return elapsed, "ok", result
+    if "busy" in text:
+        return elapsed, "busy", result
+    raise RuntimeError(f"Login failed for {username}")
+
+
+async def log_in(base_url, username):
+    """One login in a fresh session. Returns (seconds, outcome) for the form submit."""
+    async with connect(base_url) as ws:
+        elapsed, outcome, _ = await submit_login(ws, base_url, username)
+    return elapsed, outcome
+
+
+async def session_logins(base_url, username, logins):
+    return [await log_in(base_url, username) for _ in range(logins)]
+
+
+async def run_level(base_url, concurrency, logins):
+    started = time.perf_counter()
+    results = await asyncio.gather(*(session_logins(base_url, f"student{i}", logins) for i in range(concurrency)))
+    return time.perf_counter() - started, [result for session in results for result in session]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--logins", type=int, default=10, help="logins per client at each level")
+    parser.add_argument("--rounds", type=int, default=12, help="bcrypt cost of the stored hashes and the app")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="study-hub-logins-") as work_dir:
+        os.chdir(work_dir) # .user_data is relative to the working directory
+        seed_users(max(args.concurrency))
+        hashed = bcrypt.hashpw(BENCH_PASSWORD.encode("utf-8"), bcrypt.gensalt(rounds=args.rounds)).decode("utf-8")
+        with sqlite3.connect(Path(".user_data") / "users.db") as conn:
+            conn.execute("UPDATE users SET hashed_password = ?", (hashed,))
+
+        server, base_url = start_server(work_dir, {"STUDY_HUB_BCRYPT_ROUNDS": str(args.rounds)})
+        try:
+            asyncio.run(run_level(base_url, 1, 1)) # Warm up imports and the shared pools
+            print(f"bcrypt cost {args.rounds}, {os.cpu_count()} CPUs, {args.logins} logins per client")
+            for concurrency in args.concurrency:
+                elapsed, results = asyncio.run(run_level(base_url, concurrency, args.logins))
+                latencies = [seconds for seconds, outcome in results if outcome == "ok"]
+                busy = sum(1 for _, outcome in results if outcome == "busy")
+                print(
+                    f"{concurrency:3d} clients  {len(latencies) / elapsed:7.1f} logins/s  "
+                    f"p50 {percentile(latencies, 0.50) * 1000:8.1f} ms  p95 {percentile(latencies, 0.95) * 1000:8.1f} ms  "
+                    f"busy {busy}"
+                )
+        finally:
+            server.terminate()
+            server.wait(timeout=30)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""Load test for the background Read Aloud job queue under concurrent clicks.
+
+Starts a real Streamlit server on the app with a stub TTS backend that sleeps for
+each chunk. Many websocket clients log in and spread over a few subtopics. They
+then all click "Read Explanation Aloud" at once, the way a browser does: the
+button sits in a fragment, so each click reruns only that fragment. Clicks only
+queue a job, so a click's time is its fragment run plus its wait for the CPU
+behind the other clicks, never synthesis. Clients on the same subtopic share one
+job. Each client then polls its job's progress fragment at the interval the app
+asks for until its audio is shown. The script reports click latency and time to
+audio across the clients, and how many clicks the queue turned away as busy. It
+fails unless every client gets its audio.
+
+Usage:
+    python benchmarks/load_tts_queue.py --sessions 100 --subtopics 10 --delay 0.5
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from bench_study_hub import percentile, seed_users, write_synthetic_content
+from load_logins import connect, run_script, start_server, submit_login, widget_ids
+
+READ_ALOUD_LABEL = "🔊 Read Explanation Aloud"
+
+
+def audio_state(elements):
+    """"audio" once the page shows the finished clip, "failed" on a failed job, else None."""
+    kinds = {element.WhichOneof("type") for _, element in elements}
+    if "audio" in kinds and "progress" not in kinds:
+        return "audio"
+    if any("Failed to generate audio" in str(element) for _, element in elements):
+        return "failed"
+    return None
+
+
+async def read_aloud(base_url, username, subtopic, clicks, timeout):
+    """One client: logs in, opens a subtopic, waits at the clicks barrier, clicks Read Aloud and polls until the audio shows.
+
+    Returns (click seconds, seconds from click to audio or None, outcome).
+    """
+    async with connect(base_url) as ws:
+        _, outcome, page = await submit_login(ws, base_url, username)
+        if outcome != "ok":
+            raise RuntimeError(f"Login turned away for {username}")
+        states = [(widget_ids(page, kinds=("radio",))["Select Subtopic:"][0], "string_value", subtopic)]
+        page = await run_script(ws, base_url, states)
+        button_id, fragment_id = widget_ids(page)[READ_ALOUD_LABEL]
+        await clicks.wait() # Every client clicks at once
+
+        polled = {}
+        started = time.perf_counter()
+        elements = await run_script(ws, base_url, [*states, (button_id, "trigger_value", True)], fragment_id, polled)
+        click_seconds = time.perf_counter() - started
+        if any("Too many audio requests" in str(element) for _, element in elements):
+            return click_seconds, None, "busy"
+        # Poll the job's fragment like the browser's timer would, until the app redraws it without one
+        while not audio_state(elements) and polled and time.perf_counter() - started < timeout:
+            fragment_id, interval = list(polled.items())[-1] # The last fragment the app set a timer on
+            await asyncio.sleep(interval)
+            elements = await run_script(ws, base_url, states, fragment_id, polled)
+        outcome = audio_state(elements) or "timeout"
+        return click_seconds, time.perf_counter() - started if outcome == "audio" else None, outcome
+
+
+async def run_clients(base_url, sessions, subtopics, timeout):
+    clicks = asyncio.Barrier(sessions)
+    return await asyncio.gather(*(
+        read_aloud(base_url, f"student{i}", f"Subtopic 0.0.{i % subtopics}", clicks, timeout) for i in range(sessions)
+    ))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=100, help="clients clicking at once")
+    parser.add_argument("--subtopics", type=int, default=10, help="distinct texts (and so jobs) requested")
+    parser.add_argument("--delay", type=float, default=0.5, help="stub synthesis time per chunk, in seconds")
+    parser.add_argument("--timeout", type=float, default=300, help="give up waiting for audio after this long")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="study-hub-tts-load-") as work_dir:
+        work_dir = Path(work_dir)
+        write_synthetic_content(work_dir / "content", 1, 1, args.subtopics, 5)
+        os.chdir(work_dir) # .user_data is relative to the working directory
+        seed_users(args.sessions)
+        server, base_url = start_server(work_dir, {
+            "STUDY_HUB_TTS_STUB_DELAY": str(args.delay),
+            "STUDY_HUB_CONTENT_DIR": str(work_dir / "content"),
+            "STUDY_HUB_TTS_CACHE_DIR": str(work_dir / "tts"), # Keep stub clips out of the checkout's static/tts
+        })
+        try:
+            results = asyncio.run(run_clients(base_url, args.sessions, args.subtopics, args.timeout))
+        finally:
+            server.terminate()
+            server.wait(timeout=30)
+
+    click_times = [click for click, _, _ in results]
+    ready_after = [ready for _, ready, outcome in results if outcome == "audio"]
+    outcomes = {outcome: sum(1 for *_, other in results if other == outcome) for _, _, outcome in results}
+    print(f"{args.sessions} concurrent clients, {args.subtopics} distinct texts, {args.delay:.2f}s per stub chunk, {os.cpu_count()} CPUs")
+    print(f"click fragment run  p50 {percentile(click_times, 0.50) * 1000:8.1f} ms  "
+          f"p95 {percentile(click_times, 0.95) * 1000:8.1f} ms  max {max(click_times) * 1000:8.1f} ms")
+    if ready_after:
+        print(f"audio shown after   p50 {percentile(ready_after, 0.50):6.2f} s  max {max(ready_after):6.2f} s")
+    print("  ".join(f"{outcome} {count}" for outcome, count in sorted(outcomes.items())))
+    if outcomes.get("audio", 0) != args.sessions:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+"""Compares serving Read Aloud clips inline (st.audio(bytes)) with serving them from static files.
+
+Starts a real Streamlit server for each approach with a small driver script
+that plays one clip the way the app does: the old code passed the clip's bytes
+to st.audio, and the current code passes the URL of the clip's file under
+static/tts/. Many websocket sessions then open the page at once. Each session
+downloads its clip in full, then seeks to the middle with a Range request.
+The script reports the server's RSS growth, websocket bytes per play, and HTTP
+bytes per full play and per seek.
+
+Usage:
+    python benchmarks/measure_tts_delivery.py --sessions 100 --clips 10 --clip-kib 300
+"""
+import argparse
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from pathlib import Path
+
+import websockets
+from streamlit.proto.BackMsg_pb2 import BackMsg
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+
+# Driver scripts: the clip number comes from the query string, as if from a different subtopic
+INLINE_APP = '''
+from pathlib import Path
+import streamlit as st
+clip = Path(__file__).parent / "static" / "tts" / f"{st.query_params['clip']}.mp3"
+st.audio(clip.read_bytes(), format="audio/mp3")
+'''
+STATIC_APP = '''
+from urllib.parse import urljoin
+import streamlit as st
+st.audio(urljoin(st.context.url, f"app/static/tts/{st.query_params['clip']}.mp3"), format="audio/mpeg")
+'''
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("localhost", 0))
+        return sock.getsockname()[1]
+
+
+def rss_kib(pid):
+    for line in Path(f"/proc/{pid}/status").read_text().splitlines():
+        if line.startswith("VmRSS:"):
+            return int(line.split()[1])
+    return 0
+
+
+def http_get(url, byte_range=None):
+    """Returns (status, bytes received) for a GET, optionally with a Range header."""
+    request = urllib.request.Request(url, headers={"Range": f"bytes={byte_range}"} if byte_range else {})
+    with urllib.request.urlopen(request, timeout=60) as response:
+        return response.status, len(response.read())
+
+
+async def play(base_url, clip, clip_bytes):
+    """One session: runs the page, then downloads the clip and seeks to its middle while connected."""
+    ws_url = base_url.replace("http://", "ws://") + "_stcore/stream"
+    async with websockets.connect(ws_url, max_size=None) as ws:
+        msg = BackMsg()
+        msg.rerun_script.query_string = f"clip={clip}"
+        msg.rerun_script.context_info.url = base_url
+        await ws.send(msg.SerializeToString())
+        ws_bytes, audio_url = 0, None
+        while True:
+            data = await asyncio.wait_for(ws.recv(), 60)
+            ws_bytes += len(data)
+            forward = ForwardMsg()
+            forward.ParseFromString(data)
+            kind = forward.WhichOneof("type")
+            if kind == "delta" and forward.delta.new_element.WhichOneof("type") == "audio":
+                audio_url = forward.delta.new_element.audio.url
+            elif kind == "script_finished":
+                break
+        if audio_url is None:
+            raise RuntimeError("The driver script didn't render an audio element")
+        if audio_url.startswith("/"):
+            audio_url = base_url.rstrip("/") + audio_url
+        full_status, full_bytes = await asyncio.to_thread(http_get, audio_url)
+        seek_status, seek_bytes = await asyncio.to_thread(http_get, audio_url, f"{clip_bytes // 2}-")
+    if full_status != 200 or seek_status != 206:
+        raise RuntimeError(f"Unexpected statuses {full_status}/{seek_status} for {audio_url}")
+    return ws_bytes, full_bytes, seek_bytes
+
+
+async def play_all(base_url, sessions, clips, clip_bytes):
+    return await asyncio.gather(*(play(base_url, i % clips, clip_bytes) for i in range(sessions)))
+
+
+def measure(work_dir, driver, sessions, clips, clip_bytes):
+    """Runs one server with the given driver script and plays every session against it."""
+    app_path = work_dir / f"{driver}.py"
+    app_path.write_text(INLINE_APP if driver == "inline" else STATIC_APP, encoding="utf-8")
+    port = free_port()
+    base_url = f"http://localhost:{port}/"
+    server = subprocess.Popen(
+        [sys.executable, "-m", "streamlit", "run", str(app_path), "--server.headless", "true",
+         "--server.port", str(port), "--server.enableStaticServing", "true",
+         "--browser.gatherUsageStats", "false"],
+        cwd=work_dir, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        for _ in range(120):
+            try:
+                http_get(base_url + "_stcore/health")
+                break
+            except OSError:
+                time.sleep(0.25)
+        asyncio.run(play_all(base_url, 1, 1, clip_bytes)) # Warm up imports and the first session
+        rss_before = rss_kib(server.pid)
+        results = asyncio.run(play_all(base_url, sessions, clips, clip_bytes))
+        rss_after = rss_kib(server.pid)
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+    count = len(results)
+    return {
+        "rss_growth_mib": (rss_after - rss_before) / 1024,
+        "ws_bytes_per_play": sum(r[0] for r in results) / count,
+        "http_bytes_per_full_play": sum(r[1] for r in results) / count,
+        "http_bytes_per_seek": sum(r[2] for r in results) / count,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=100)
+    parser.add_argument("--clips", type=int, default=10, help="distinct clips the sessions play")
+    parser.add_argument("--clip-kib", type=int, default=300, help="size of each clip")
+    args = parser.parse_args()
+
+    clip_bytes = args.clip_kib * 1024
+    with tempfile.TemporaryDirectory(prefix="study-hub-tts-delivery-") as work_dir:
+        work_dir = Path(work_dir)
+        (work_dir / "static" / "tts").mkdir(parents=True)
+        for clip in range(args.clips):
+            (work_dir / "static" / "tts" / f"{clip}.mp3").write_bytes(os.urandom(clip_bytes))
+        print(f"{args.sessions} sessions playing {args.clips} distinct {args.clip_kib} KiB clips")
+        for driver in ("inline", "static"):
+            result = measure(work_dir, driver, args.sessions, args.clips, clip_bytes)
+            print(
+                f"{driver:7s} RSS +{result['rss_growth_mib']:7.1f} MiB  "
+                f"websocket {result['ws_bytes_per_play']:7.0f} B/play  "
+                f"HTTP {result['http_bytes_per_full_play'] / 1024:7.1f} KiB/full play  "
+                f"{result['http_bytes_per_seek'] / 1024:7.1f} KiB/seek"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""Stress test for concurrent registration against one shared user store.
+
+Worker processes submit the Register form through Streamlit's AppTest harness,
+all sharing one working directory (and so one .user_data volume). Every username
+is attempted by two different processes at once, in a different order in each.
+The run fails if any username is lost, stored twice, or reported as registered
+to more than one session.
+
+Usage:
+    python benchmarks/stress_registration.py --users 2000 --processes 8
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from collections import Counter
+from pathlib import Path
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+APP_PATH = REPO_DIR / "code (3).py"
+STRESS_PASSWORD = "stresspass"
+
+
+def register_worker(work_dir, usernames, seed):
+    """Registers usernames in random order. Returns the ones this process was told succeeded."""
+    os.chdir(work_dir)
+    os.environ.setdefault("STUDY_HUB_BCRYPT_ROUNDS", "4")
+    from streamlit.testing.v1 import AppTest
+
+    usernames = list(usernames)
+    random.Random(seed).shuffle(usernames)
+    at = AppTest.from_file(str(APP_PATH), default_timeout=60)
+    at.run()
+    succeeded = []
+    for username in usernames:
+        at.text_input(key="reg_user").input(username)
+        at.text_input(key="reg_pass").input(STRESS_PASSWORD)
+        at.text_input(key="reg_pass_confirm").input(STRESS_PASSWORD)
+        next(button for button in at.button if button.label == "Register").click().run()
+        if at.exception:
+            raise RuntimeError(f"App raised while registering {username}: {at.exception[0].value}")
+        if any("registered successfully" in message.value for message in at.success):
+            succeeded.append(username)
+    return succeeded
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--processes", type=int, default=8)
+    args = parser.parse_args()
+    if args.processes < 2:
+        parser.error("--processes must be at least 2 for registrations to race")
+
+    usernames = [f"racer{i}" for i in range(args.users)]
+    # Username k goes to processes k % P and (k + 1) % P, so every name is contested
+    assignments = [[] for _ in range(args.processes)]
+    for k, username in enumerate(usernames):
+        assignments[k % args.processes].append(username)
+        assignments[(k + 1) % args.processes].append(username)
+
+    with tempfile.TemporaryDirectory(prefix="study-hub-stress-") as work_dir:
+        started = time.perf_counter()
+        with multiprocessing.get_context("spawn").Pool(args.processes) as pool:
+            results = pool.starmap(
+                register_worker, [(work_dir, names, seed) for seed, names in enumerate(assignments)]
+            )
+        elapsed = time.perf_counter() - started
+        with sqlite3.connect(Path(work_dir) / ".user_data" / "users.db") as conn:
+            stored = Counter(row[0] for row in conn.execute("SELECT username FROM users"))
+
+    reported = Counter(username for succeeded in results for username in succeeded)
+    lost = [username for username in usernames if username not in stored]
+    duplicated = [username for username, count in stored.items() if count > 1]
+    double_reported = [username for username, count in reported.items() if count > 1]
+    unreported = [username for username in usernames if reported[username] == 0]
+
+    attempts = sum(len(names) for names in assignments)
+    print(f"{attempts} registration attempts for {args.users} usernames across {args.processes} processes "
+          f"in {elapsed:.1f}s ({attempts / elapsed:.0f}/s)")
+    print(f"stored {len(stored)}, lost {len(lost)}, duplicated {len(duplicated)}, "
+          f"reported twice {len(double_reported)}, never reported {len(unreported)}")
+    if lost or duplicated or double_reported or unreported:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,469 +1,1944 @@
 import streamlit as st
 import json
+import os
+import hashlib # Content hashes for the TTS cache, bcrypt for passwords
+import cProfile
+import csv
+import functools
+import heapq
+import math
 import time
+import logging
+import re
+import sys
+import threading
+import tracemalloc
+from bisect import bisect_left
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing, contextmanager
 from pathlib import Path
-import hashlib # Using hashlib just for user file naming, bcrypt for passwords
+from urllib.parse import urljoin
 import bcrypt
+import numpy as np
+import streamlit.components.v1 as components
 from gtts import gTTS
 import io
 from PIL import Image # For potential future logo/image use
+from streamlit.runtime.scriptrunner import get_script_run_ctx
 
 # --- Configuration & Constants ---
-USER_DATA_DIR = Path(".user_data") # Directory to store user "databases" (INSECURE)
-USER_DATA_DIR.mkdir(exist_ok=True) # Create dir if it doesn't exist
+USER_DATA_DIR = Path(".user_data") # Directory to store user "databases" (INSECURE), created by init_user_store()
+USER_DB_FILENAME = "users.db" # SQLite user store inside USER_DATA_DIR
+USER_DB_BUSY_TIMEOUT_SECONDS = 30 # How long a writer waits for another process's lock on the store
 SESSION_TIMEOUT_SECONDS = 15 * 60 # 15 minutes idle timeout approximation
+BCRYPT_ROUNDS = int(os.environ.get("STUDY_HUB_BCRYPT_ROUNDS", "12")) # Work factor; older hashes are upgraded on login
+PASSWORD_POOL_WORKERS = 4 # Max bcrypt operations running at once per process
+PASSWORD_QUEUE_LIMIT = 32 # Max bcrypt jobs queued + running before logins are turned away
+# Admins may bulk-import students. Rights come from the username alone, so register an admin's
+# account first, then list it here; names listed here can't be registered through the form.
+ADMIN_USERNAMES = set(filter(None, os.environ.get("STUDY_HUB_ADMINS", "").split(",")))
+IMPORT_BATCH_SIZE = 500 # Students hashed and committed per transaction; an interrupted import keeps its finished batches
+IMPORT_HASH_WORKERS = os.cpu_count() or 1 # Bulk imports hash on every core, apart from the login pool
+MIN_PASSWORD_LENGTH = 6
+TTS_BACKEND = os.environ.get("STUDY_HUB_TTS_BACKEND", "gtts") # "gtts", or "stub" for offline tests
+TTS_STATIC_DIR = Path(__file__).resolve().parent / "static" / "tts" # Served at app/static/tts/
+TTS_CACHE_DIR = Path(os.environ.get("STUDY_HUB_TTS_CACHE_DIR", TTS_STATIC_DIR)).resolve() # Content-addressed clip store; benchmarks point it elsewhere
+TTS_STATIC_URL_PATH = "app/static/tts/" # Needs server.enableStaticServing (see .streamlit/config.toml)
+TTS_DISK_CACHE_MAX_BYTES = int(os.environ.get("STUDY_HUB_TTS_CACHE_MAX_BYTES", 200 * 1024 * 1024)) # Oldest clips are evicted past this size
+TTS_CHUNK_CHARS = int(os.environ.get("STUDY_HUB_TTS_CHUNK_CHARS", "400")) # Long texts are synthesized in chunks of about this size
+TTS_POOL_WORKERS = 4 # Max chunks synthesized at once per process
+TTS_MAX_ACTIVE_JOBS = 64 # Distinct Read Aloud jobs queued or running before new ones are turned away
+TTS_JOB_RETENTION_SECONDS = SESSION_TIMEOUT_SECONDS # Finished jobs no session released are dropped after this
+TTS_POLL_SECONDS = 1 # How often a page checks on its running Read Aloud job
+TTS_STUB_DELAY_SECONDS = float(os.environ.get("STUDY_HUB_TTS_STUB_DELAY", "0")) # Simulated synthesis time for load tests...
+TTS_STUB_CHAR_DELAY_SECONDS = float(os.environ.get("STUDY_HUB_TTS_STUB_CHAR_DELAY", "0")) # ...plus this per character, as gTTS's requests grow with the text
+TTS_PLAYER_HEIGHT = 80 # Pixels for the Read Aloud player
+ALLOC_PROFILE = os.environ.get("STUDY_HUB_ALLOC_PROFILE") == "1" # Log each rerun's allocations by source line
+METRICS_FILE = Path(os.environ.get("STUDY_HUB_METRICS_FILE", ".metrics/study_hub.prom")) # Prometheus text format
+METRICS_EXPORT_INTERVAL_SECONDS = float(os.environ.get("STUDY_HUB_METRICS_EXPORT_SECONDS", "15")) # Benchmarks shorten it to read spans sooner
+METRICS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0) # Span histogram bounds (s)
+PROFILE_SLOWEST_RERUNS = int(os.environ.get("STUDY_HUB_PROFILE_SLOWEST", "0")) # Keep cProfile dumps of the N slowest reruns (0 = off)
+PROFILE_DIR = Path(".profiles")
 
-# --- Syllabus Structure (Placeholder - Needs massive content population) ---
-# This is the core data structure. You MUST populate this extensively.
-syllabus = {
-    "Mathematics": {
-        "Algebra": {
-            "Quadratic Equations": {
-                "detail": """
-                    **Introduction:**
-                    A quadratic equation is a polynomial equation of the second degree. The general form is ax² + bx + c = 0, where x represents an unknown, and a, b, and c represent known numbers, with a ≠ 0.
-
-                    **Methods of Solving:**
-                    1.  **Factorization:** Expressing the quadratic as a product of two linear factors.
-                    2.  **Completing the Square:** Manipulating the equation to form a perfect square.
-                    3.  **Quadratic Formula:** x = [-b ± sqrt(b² - 4ac)] / (2a). Derived from completing the square.
-
-                    **Discriminant:**
-                    The term b² - 4ac is called the discriminant (Δ). It tells us about the nature of the roots:
-                    *   Δ > 0: Two distinct real roots.
-                    *   Δ = 0: One real root (or two equal real roots).
-                    *   Δ < 0: Two complex conjugate roots (no real roots).
-
-                    **Examples:**
-                    *   Solve x² - 5x + 6 = 0 by factorization: (x-2)(x-3) = 0 => x=2 or x=3.
-                    *   Solve 2x² + 4x - 1 = 0 using the formula: x = [-4 ± sqrt(4² - 4*2*(-1))] / (2*2) = [-4 ± sqrt(24)] / 4 = [-4 ± 2*sqrt(6)] / 4 = [-1 ± sqrt(6)/2].
-                """,
-                "notes": """
-                    *   **Key Formula:** x = [-b ± sqrt(b² - 4ac)] / (2a)
-                    *   **Discriminant:** Δ = b² - 4ac (Nature of roots)
-                    *   **Factorization:** Quickest if easily factorable.
-                    *   **Remember:** 'a' cannot be zero.
-                """,
-                "flashcards": [
-                    {"q": "General form of a quadratic equation?", "a": "ax² + bx + c = 0, a ≠ 0"},
-                    {"q": "What is the quadratic formula?", "a": "x = [-b ± sqrt(b² - 4ac)] / (2a)"},
-                    {"q": "What does the discriminant (Δ) tell us?", "a": "The nature of the roots (real/distinct, real/equal, complex)"},
-                    {"q": "What is Δ if roots are real and equal?", "a": "Δ = 0"},
-                ]
-            },
-            "Simultaneous Equations": {
-                "detail": "Placeholder: Detailed explanation of solving linear and non-linear simultaneous equations...",
-                "notes": "Placeholder: Key methods (Substitution, Elimination)...",
-                "flashcards": [{"q": "Placeholder Q", "a": "Placeholder A"}]
-            }
-            # ... more Algebra subtopics
-        },
-        "Geometry": {
-            "Circle Theorems": {
-                "detail": "Placeholder: Angle at center, angle in semicircle, angles in same segment, cyclic quadrilaterals...",
-                "notes": "Placeholder: Diagrams and key theorems...",
-                "flashcards": [{"q": "Placeholder Q", "a": "Placeholder A"}]
-            }
-            # ... more Geometry subtopics
-        }
-        # ... more Maths topics
-    },
-    "Physics": {
-        "Mechanics": {
-            "Kinematics": {
-                "detail": "Placeholder: Speed, velocity, acceleration, equations of motion (suvat)...",
-                "notes": "Placeholder: Definitions, formulas, graphs (d-t, v-t)...",
-                "flashcards": [{"q": "Define velocity", "a": "Rate of change of displacement"}]
-            },
-            # ... more Mechanics subtopics
-        },
-         # ... more Physics topics (e.g., Thermal Physics, Waves, Electricity)
-    },
-    "Chemistry": {
-        "Atomic Structure": {
-             "Protons, Neutrons, Electrons": {
-                  "detail": "Placeholder: Location, relative mass, relative charge...",
-                  "notes": "Placeholder: Key table, isotopes definition...",
-                  "flashcards": [{"q": "Relative charge of electron?", "a": "-1"}]
-             }
-             # ...
-        }
-        # ... more Chemistry topics (e.g., Mole Concept, Periodic Table, Organic Chem)
-    },
-    "Computer Science": {
-        "Programming Concepts": {
-             "Variables and Data Types": {
-                 "detail": "Placeholder: Integers, floats, strings, booleans, variable assignment...",
-                 "notes": "Placeholder: Naming conventions, type casting...",
-                 "flashcards": [{"q": "What is an integer?", "a": "A whole number"}]
-             }
-             # ... more Programming subtopics
-        }
-        # ... more CS topics (e.g., Hardware, Networking, Databases)
-    },
-    "Biology": {
-         "Cell Biology": {
-              "Animal vs Plant Cells": {
-                   "detail": "Placeholder: Diagrams, organelles (nucleus, mitochondria, chloroplasts, cell wall...)",
-                   "notes": "Placeholder: Key differences table...",
-                   "flashcards": [{"q": "Function of chloroplasts?", "a": "Photosynthesis"}]
-              }
-              # ...
-         }
-         # ... more Biology topics (e.g., Transport, Respiration, Genetics)
-    },
-    "English": {
-         "Composition": {
-             "Narrative Writing": {
-                 "detail": "Placeholder: Structure, character development, plot, setting, descriptive language...",
-                 "notes": "Placeholder: Planning techniques, useful vocabulary...",
-                 "flashcards": [{"q": "What is a plot?", "a": "The sequence of events in a story"}]
-            }
-         }
-        # ... more English topics (e.g., Comprehension, Summary, Grammar)
-    },
-    "Pakistan Studies": {
-         "History": {
-              "The Pakistan Movement": {
-                    "detail": "Placeholder: Key events, personalities (Allama Iqbal, Quaid-e-Azam), Lahore Resolution...",
-                    "notes": "Placeholder: Timeline, key dates...",
-                    "flashcards": [{"q": "When was the Lahore Resolution passed?", "a": "1940"}]
-              }
-              # ...
-         }
-         # ... more Pak Studies topics (e.g., Geography, Culture)
-    },
-    "Islamiat": {
-        "Quranic Passages": {
-             "Surah Al-Fatiha": {
-                 "detail": "Placeholder: Translation, context, key themes...",
-                 "notes": "Placeholder: Importance, main points...",
-                 "flashcards": [{"q": "How many verses in Surah Al-Fatiha?", "a": "7"}]
-             }
-             # ...
-        }
-        # ... more Islamiat topics (e.g., Hadith, Pillars of Islam, History)
-    },
+logger = logging.getLogger(__name__)
+
+if ALLOC_PROFILE:
+    logging.basicConfig()
+    logger.setLevel(logging.INFO)
+    if not tracemalloc.is_tracing():
+        tracemalloc.start()
+    tracemalloc.reset_peak()
+    rerun_alloc_snapshot = tracemalloc.take_snapshot()
+
+rerun_started = time.perf_counter()
+rerun_profiler = None
+if PROFILE_SLOWEST_RERUNS:
+    rerun_profiler = cProfile.Profile()
+    try:
+        rerun_profiler.enable()
+    except ValueError:
+        rerun_profiler = None # Another session's rerun is being profiled right now
+
+# --- Syllabus Content ---
+# Content lives in per-subject pack files under content/ (you MUST populate these extensively).
+# content/manifest.json maps each subject to its pack file and lists its topics -> subtopics,
+# and each pack maps topic -> subtopic -> {"detail", "notes", "flashcards"}.
+CONTENT_DIR = Path(os.environ.get("STUDY_HUB_CONTENT_DIR", Path(__file__).resolve().parent / "content"))
+CONTENT_PACK_CACHE_SIZE = 8 # Subject packs kept parsed in memory, shared by all sessions
+COMPILED_FIELDS = ("detail", "notes") # Markdown texts compiled into speech text for Read Aloud
+MARKDOWN_BLOCK_PREFIX_RE = re.compile(r"^\s*(#+|>|[*+-])\s+") # Headings, quotes and bullets
+MARKDOWN_LINK_RE = re.compile(r"\[([^\]]*)\]\([^)]*\)")
+# Emphasis delimiters must sit on a word boundary, so "4*2*(-1)" and "2*sqrt(6)" keep their multiplication signs
+MARKDOWN_EMPHASIS_RE = re.compile(r"(?<![\w)*])(\*\*|__|\*|_)(?=\S)(.+?)(?<=\S)\1(?![\w(*])")
+MARKDOWN_CODE_RE = re.compile(r"`([^`]+)`")
+CONTENT_TABS = {
+    "detail": "📖 Detailed Explanation",
+    "notes": "📝 Revision Notes",
+    "flashcards": "💡 Flashcards",
 }
+SEARCH_FIELD_WEIGHTS = {"title": 3.0, "flashcards": 2.0, "notes": 1.5, "detail": 1.0} # Where a match counts most
+SEARCH_MAX_RESULTS = 8
+SEARCH_MAX_PREFIX_EXPANSIONS = 50 # Index words a query prefix may expand to
+SRS_GRADES = {"❌ Again": 1, "✅ Good": 4, "⭐ Easy": 5} # SM-2 answer quality (0-5) for each grade button
+SRS_DEFAULT_EASE = 2.5
+SRS_MIN_EASE = 1.3
+SRS_AGAIN_DELAY_SECONDS = 10 * 60 # Forgotten cards come back after 10 minutes
+SRS_PASS_QUALITY = 3 # Grades below this count as forgotten (a miss)
+SRS_DUE_BATCH = 20 # Due cards fetched at a time when looking past stale schedule rows
+MIXED_REVIEW_DEFAULT_CARDS = 50
+MIXED_REVIEW_MAX_CARDS = 200
+STUDY_EVENT_BATCH_SIZE = 20 # Buffered study events are written once this many pile up...
+STUDY_EVENT_FLUSH_SECONDS = 60 # ...or once this long has passed since the last write
 
 # --- Helper Functions ---
 
-def get_user_db_path(username):
-    """Generates a filename based on username hash."""
-    # Use hash to avoid potentially problematic chars in filenames
-    username_hash = hashlib.sha256(username.encode()).hexdigest()[:16]
-    return USER_DATA_DIR / f"{username_hash}.json"
+# --- Metrics ---
+# Spans and counters are aggregated in-process under one lock and written out as a
+# Prometheus text file every METRICS_EXPORT_INTERVAL_SECONDS (point node_exporter's
+# textfile collector, or anything else that reads the format, at METRICS_FILE).
+
+@st.cache_resource
+def get_metrics():
+    """Process-wide metrics registry, shared by all sessions."""
+    return {
+        "lock": threading.Lock(),
+        "counters": {}, # name -> value
+        "spans": {}, # name -> {"count", "sum", "buckets"}
+        "sessions": {}, # session id -> last seen, logged in
+        "exported_at": 0.0,
+        "slowest_profiles": [], # min-heap of (seconds, dump path)
+    }
+
+def count_event(name, value=1):
+    """Increments a counter."""
+    metrics = get_metrics()
+    with metrics["lock"]:
+        metrics["counters"][name] = metrics["counters"].get(name, 0) + value
+
+def observe_span(name, seconds):
+    """Records one duration in a span's histogram."""
+    metrics = get_metrics()
+    with metrics["lock"]:
+        span = metrics["spans"].get(name)
+        if span is None:
+            span = metrics["spans"][name] = {"count": 0, "sum": 0.0, "buckets": [0] * (len(METRICS_BUCKETS) + 1)}
+        span["count"] += 1
+        span["sum"] += seconds
+        span["buckets"][bisect_left(METRICS_BUCKETS, seconds)] += 1
+
+@contextmanager
+def timed(name):
+    """Times a block (or, used as a decorator, every call of a function) as span name."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_span(name, time.perf_counter() - started)
+
+def export_metrics(force=False):
+    """Writes all metrics to METRICS_FILE in Prometheus text format, at most once per interval."""
+    metrics = get_metrics()
+    now = time.time()
+    with metrics["lock"]:
+        if not force and now - metrics["exported_at"] < METRICS_EXPORT_INTERVAL_SECONDS:
+            return
+        metrics["exported_at"] = now
+        lines = ["# TYPE study_hub_span_seconds histogram"]
+        for name, span in sorted(metrics["spans"].items()):
+            cumulative = 0
+            for bound, bucket_count in zip(METRICS_BUCKETS + (float("inf"),), span["buckets"]):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f'study_hub_span_seconds_bucket{{span="{name}",le="{le}"}} {cumulative}')
+            lines.append(f'study_hub_span_seconds_sum{{span="{name}"}} {span["sum"]}')
+            lines.append(f'study_hub_span_seconds_count{{span="{name}"}} {span["count"]}')
+        lines.append("# TYPE study_hub_events_total counter")
+        for name, value in sorted(metrics["counters"].items()):
+            lines.append(f'study_hub_events_total{{event="{name}"}} {value}')
+        # Sessions seen within the idle timeout count as active; older ones are gone for good
+        metrics["sessions"] = {
+            session_id: seen for session_id, seen in metrics["sessions"].items() if now - seen[0] < SESSION_TIMEOUT_SECONDS
+        }
+        active = [logged_in for _, logged_in in metrics["sessions"].values()]
+        lines.append("# TYPE study_hub_active_sessions gauge")
+        lines.append(f'study_hub_active_sessions{{state="logged_in"}} {sum(active)}')
+        lines.append(f'study_hub_active_sessions{{state="logged_out"}} {len(active) - sum(active)}')
+    tts_cache = get_tts_cache()
+    with tts_cache["lock"]:
+        lines.append("# TYPE study_hub_tts_cache_lookups_total counter")
+        for result in ("hits", "misses"):
+            lines.append(f'study_hub_tts_cache_lookups_total{{result="{result}"}} {tts_cache[result]}')
+    try:
+        METRICS_FILE.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = METRICS_FILE.with_suffix(f".{os.getpid()}.tmp")
+        tmp_path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+        os.replace(tmp_path, METRICS_FILE) # Scrapers never see a half-written file
+    except OSError:
+        logger.warning("Could not write metrics file %s", METRICS_FILE)
+
+def keep_profile_if_slow(profiler, seconds):
+    """Dumps a rerun's cProfile stats if it is among the PROFILE_SLOWEST_RERUNS slowest so far."""
+    metrics = get_metrics()
+    with metrics["lock"]:
+        slowest = metrics["slowest_profiles"]
+        if len(slowest) >= PROFILE_SLOWEST_RERUNS and seconds <= slowest[0][0]:
+            return
+        PROFILE_DIR.mkdir(exist_ok=True)
+        dump_path = PROFILE_DIR / f"rerun-{seconds * 1000:.0f}ms-{time.time():.0f}-{threading.get_ident()}.prof"
+        profiler.dump_stats(dump_path)
+        heapq.heappush(slowest, (seconds, str(dump_path)))
+        if len(slowest) > PROFILE_SLOWEST_RERUNS:
+            _, dropped = heapq.heappop(slowest)
+            Path(dropped).unlink(missing_ok=True)
+
+def finish_rerun(started, profiler):
+    """End-of-script bookkeeping: rerun span, session tracking, slow-rerun profiles, export."""
+    if profiler is not None:
+        profiler.disable()
+    seconds = time.perf_counter() - started
+    observe_span("script_rerun", seconds)
+    ctx = get_script_run_ctx()
+    if ctx is not None:
+        metrics = get_metrics()
+        with metrics["lock"]:
+            metrics["sessions"][ctx.session_id] = (time.time(), bool(st.session_state.get("logged_in")))
+    if profiler is not None:
+        keep_profile_if_slow(profiler, seconds)
+    export_metrics()
+
+def content_file_version(file_name):
+    """Modification time of a content file, used as a cache key so edits invalidate cached copies."""
+    try:
+        return (CONTENT_DIR / file_name).stat().st_mtime_ns
+    except OSError:
+        return None
+
+@st.cache_resource(max_entries=2)
+def load_syllabus_manifest(version):
+    """Loads the subjects -> topics -> subtopics outline. Bodies stay on disk until opened."""
+    with open(CONTENT_DIR / "manifest.json", 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def get_syllabus_manifest():
+    """Returns the current manifest, reloading it only after manifest.json changes."""
+    return load_syllabus_manifest(content_file_version("manifest.json"))
+
+@st.cache_resource(max_entries=2)
+def build_navigation(version):
+    """Builds the sidebar's option lists and label -> position lookups (once per manifest version)."""
+    manifest = load_syllabus_manifest(version)
+    navigation = {"subjects": list(manifest), "subject_index": {}, "topics": {}, "topic_index": {}, "subtopics": {}, "subtopic_index": {}}
+    for subject_pos, (subject, subject_entry) in enumerate(manifest.items()):
+        navigation["subject_index"][subject] = subject_pos
+        navigation["topics"][subject] = list(subject_entry["topics"])
+        navigation["topic_index"][subject] = {topic: i for i, topic in enumerate(subject_entry["topics"])}
+        for topic, subtopics in subject_entry["topics"].items():
+            navigation["subtopics"][subject, topic] = list(subtopics)
+            navigation["subtopic_index"][subject, topic] = {subtopic: i for i, subtopic in enumerate(subtopics)}
+    return navigation
+
+def get_navigation():
+    """Returns the shared navigation structures for the current manifest."""
+    return build_navigation(content_file_version("manifest.json"))
+
+def read_content_pack(pack_name):
+    """Reads one subject's content pack (topic -> subtopic -> body) from disk."""
+    with open(CONTENT_DIR / pack_name, 'r', encoding='utf-8') as f:
+        return json.load(f)
 
-def load_user_data():
-    """Loads user credentials from the (insecure) user directory."""
-    users = {}
-    for user_file in USER_DATA_DIR.glob("*.json"):
+@st.cache_resource(max_entries=CONTENT_PACK_CACHE_SIZE)
+def load_content_pack(pack_name, version):
+    """Loads one subject's content pack, shared across sessions. A new version (mtime) reloads it."""
+    return read_content_pack(pack_name)
+
+def load_subtopic(subject, topic, subtopic):
+    """Returns the detail/notes/flashcards body of one subtopic ({} if it can't be found)."""
+    subject_entry = get_syllabus_manifest().get(subject)
+    if subject_entry is None:
+        return {}
+    try:
+        pack = load_content_pack(subject_entry["pack"], content_file_version(subject_entry["pack"]))
+    except (json.JSONDecodeError, IOError):
+        st.error(f"Could not load content pack for {subject}.")
+        return {}
+    return pack.get(topic, {}).get(subtopic, {})
+
+def markdown_to_speech(markdown):
+    """Speech form of a markdown text: markup stripped, one sentence per line, each ending in punctuation."""
+    sentences = []
+    for line in markdown.splitlines():
+        if re.fullmatch(r"\s*([-*_])(\s*\1){2,}\s*", line):
+            continue # Horizontal rule
+        line = MARKDOWN_BLOCK_PREFIX_RE.sub("", line)
+        line = MARKDOWN_LINK_RE.sub(r"\1", line)
+        line = MARKDOWN_CODE_RE.sub(r"\1", line)
+        line = MARKDOWN_EMPHASIS_RE.sub(r"\2", line)
+        # Keep a numbered item's "1." with its text rather than as a sentence of its own
+        number, line = re.match(r"\s*(\d+\.\s+)?(.*)", line).groups()
+        for i, sentence in enumerate(re.split(r"(?<=[.!?])\s+", line.strip())):
+            if sentence:
+                if i == 0 and number:
+                    sentence = f"{number.strip()} {sentence}"
+                # Marks the boundary so the engine pauses, even after a heading or list item
+                sentences.append(sentence if sentence[-1] in ".!?:;" else f"{sentence}.")
+    return "\n".join(sentences)
+
+@st.cache_resource
+def get_compiled_texts():
+    """Compiled texts from recent pack compiles, by content hash, so a changed pack only recompiles what changed.
+
+    Holds the CONTENT_PACK_CACHE_SIZE most recently compiled packs, like the pack caches.
+    """
+    return {
+        "lock": threading.Lock(),
+        "packs": {}, # pack name -> {sha256 of raw text: speech text}, oldest compile first
+    }
+
+def compile_text(text, previous, current):
+    """Compiles one raw text to speech, reusing the previous compile of identical text."""
+    key = hashlib.sha256(text.encode('utf-8')).hexdigest()
+    compiled = current.get(key) or previous.get(key)
+    if compiled is None:
+        compiled = markdown_to_speech(text)
+        count_event("content_text_compiled")
+    current[key] = compiled
+    return compiled
+
+@st.cache_resource(max_entries=CONTENT_PACK_CACHE_SIZE)
+def load_compiled_pack(pack_name, version):
+    """Speech text of every detail/notes text in a pack (once per pack version)."""
+    pack = load_content_pack(pack_name, version)
+    store = get_compiled_texts()
+    with store["lock"]:
+        previous = store["packs"].get(pack_name, {})
+    current, compiled_pack = {}, {}
+    for topic, subtopics in pack.items():
+        for subtopic, body in subtopics.items():
+            compiled_pack.setdefault(topic, {})[subtopic] = {
+                field: compile_text(body[field], previous, current) for field in COMPILED_FIELDS if body.get(field)
+            }
+    with store["lock"]:
+        store["packs"].pop(pack_name, None)
+        store["packs"][pack_name] = current # Texts no longer in the pack are dropped
+        while len(store["packs"]) > CONTENT_PACK_CACHE_SIZE:
+            del store["packs"][next(iter(store["packs"]))] # Least recently compiled pack
+    return compiled_pack
+
+def load_compiled_subtopic(subject, topic, subtopic):
+    """Returns {field: speech text} for a subtopic's detail and notes ({} if it can't be found)."""
+    subject_entry = get_syllabus_manifest().get(subject)
+    if subject_entry is None:
+        return {}
+    try:
+        pack = load_compiled_pack(subject_entry["pack"], content_file_version(subject_entry["pack"]))
+    except (json.JSONDecodeError, IOError):
+        return {} # load_subtopic() reports the broken pack
+    return pack.get(topic, {}).get(subtopic, {})
+
+def open_subtopic_speech(field, missing):
+    """Speech text of the open subtopic's detail or notes, or missing if it has none."""
+    compiled = load_compiled_subtopic(st.session_state.current_subject, st.session_state.current_topic, st.session_state.current_subtopic)
+    return compiled.get(field, missing)
+
+def get_user_db_path():
+    """Returns the path of the SQLite user store."""
+    return USER_DATA_DIR / USER_DB_FILENAME
+
+def connect_user_db():
+    """Opens a connection to the user store.
+
+    SQLite's file locks serialise writers across threads and worker processes sharing
+    the .user_data volume; a writer that finds the store locked waits up to
+    USER_DB_BUSY_TIMEOUT_SECONDS instead of failing.
+    """
+    return sqlite3.connect(get_user_db_path(), timeout=USER_DB_BUSY_TIMEOUT_SECONDS)
+
+@st.cache_resource
+def init_user_store():
+    """Creates the user table and migrates legacy per-user JSON files (runs once per process)."""
+    USER_DATA_DIR.mkdir(exist_ok=True) # Create dir if it doesn't exist
+    migrated_files = []
+    with closing(connect_user_db()) as conn, conn:
+        # PRIMARY KEY gives us an indexed username lookup
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS users ("
+            "username TEXT PRIMARY KEY, hashed_password TEXT NOT NULL)"
+        )
+        # Spaced repetition: append-only review log plus each card's current SM-2 state
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS card_reviews ("
+            "username TEXT NOT NULL, card_id TEXT NOT NULL, reviewed_at REAL NOT NULL, grade INTEGER NOT NULL)"
+        )
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS card_schedule ("
+            "username TEXT NOT NULL, card_id TEXT NOT NULL, "
+            "subject TEXT NOT NULL, topic TEXT NOT NULL, subtopic TEXT NOT NULL, card_index INTEGER NOT NULL, "
+            "ease REAL NOT NULL, interval_days REAL NOT NULL, repetitions INTEGER NOT NULL, due_at REAL NOT NULL, "
+            "PRIMARY KEY (username, card_id))"
+        )
+        # Due-date index: the next due cards are a range scan, not a scan of every card
+        conn.execute("CREATE INDEX IF NOT EXISTS card_schedule_due ON card_schedule (username, due_at)")
+        # Per-user review history, for miss rates in mixed review
+        conn.execute("CREATE INDEX IF NOT EXISTS card_reviews_user ON card_reviews (username, card_id, grade)") # Covers the miss-rate query
+        # Study time: append-only event log plus rollups that are updated in the same transaction
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS study_events ("
+            "username TEXT NOT NULL, kind TEXT NOT NULL, subject TEXT, topic TEXT, subtopic TEXT, "
+            "started_at REAL NOT NULL, ended_at REAL NOT NULL)"
+        )
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS study_rollups ("
+            "username TEXT NOT NULL, subject TEXT NOT NULL, topic TEXT NOT NULL, subtopic TEXT NOT NULL, "
+            "day TEXT NOT NULL, seconds REAL NOT NULL, flips INTEGER NOT NULL, "
+            "PRIMARY KEY (username, subject, topic, subtopic, day))"
+        )
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS study_totals ("
+            "username TEXT PRIMARY KEY, seconds REAL NOT NULL, flips INTEGER NOT NULL)"
+        )
+        # One-shot migration from the old <sha256[:16]>.json files
+        for user_file in USER_DATA_DIR.glob("*.json"):
+            try:
+                with open(user_file, 'r') as f:
+                    data = json.load(f)
+                conn.execute(
+                    "INSERT OR IGNORE INTO users (username, hashed_password) VALUES (?, ?)",
+                    (data["username"], data["hashed_password"]),
+                )
+                migrated_files.append(user_file)
+            except (json.JSONDecodeError, IOError, KeyError, TypeError):
+                logger.warning("Could not load or parse user file: %s. Skipping.", user_file.name)
+    # Only rename once the inserts are committed, so a failed migration can be retried
+    for user_file in migrated_files:
         try:
-            with open(user_file, 'r') as f:
-                data = json.load(f)
-                # Basic check if structure is as expected
-                if "username" in data and "hashed_password" in data:
-                     users[data["username"]] = data["hashed_password"]
-        except (json.JSONDecodeError, IOError, KeyError):
-            st.warning(f"Could not load or parse user file: {user_file.name}. Skipping.")
-            # Optional: Add logic to handle corrupted files (e.g., delete or move)
-    return users
+            user_file.rename(user_file.with_suffix(".json.migrated"))
+        except FileNotFoundError:
+            pass # Another worker process migrated it first
+    return True
+
+@timed("load_user_data")
+def load_user_data(username):
+    """Looks up a user's stored password hash (None if the user doesn't exist)."""
+    try:
+        with closing(connect_user_db()) as conn:
+            row = conn.execute(
+                "SELECT hashed_password FROM users WHERE username = ?", (username,)
+            ).fetchone()
+    except sqlite3.Error:
+        st.error("Could not read user data.")
+        return None
+    return row[0] if row else None
+
+def create_user(username, hashed_password):
+    """Atomically registers a new user. Returns False if the name is taken, None if the store failed."""
+    try:
+        with closing(connect_user_db()) as conn, conn:
+            # The PRIMARY KEY makes this create-if-absent: of two racing registrations,
+            # from any session or process, exactly one insert succeeds
+            conn.execute(
+                "INSERT INTO users (username, hashed_password) VALUES (?, ?)",
+                (username, hashed_password.decode('utf-8')), # Store hash as string
+            )
+        return True
+    except sqlite3.IntegrityError:
+        return False
+    except sqlite3.Error:
+        return None
 
 def save_user_data(username, hashed_password):
-    """Saves/updates a user's data in their individual (insecure) file."""
-    user_file = get_user_db_path(username)
-    user_info = {
-        "username": username,
-        "hashed_password": hashed_password.decode('utf-8') # Store hash as string
-    }
+    """Saves/updates a user's password hash in the user store."""
     try:
-        with open(user_file, 'w') as f:
-            json.dump(user_info, f)
+        with closing(connect_user_db()) as conn, conn:
+            conn.execute(
+                "INSERT INTO users (username, hashed_password) VALUES (?, ?) "
+                "ON CONFLICT(username) DO UPDATE SET hashed_password = excluded.hashed_password",
+                (username, hashed_password.decode('utf-8')), # Store hash as string
+            )
         return True
-    except IOError:
+    except sqlite3.Error:
         st.error("Failed to save user data.")
         return False
 
+@st.cache_resource
+def get_password_pool():
+    """Shared bounded worker pool for bcrypt work (one per process, shared by all sessions)."""
+    return {
+        # bcrypt releases the GIL while hashing, so threads run in parallel on all cores
+        "executor": ThreadPoolExecutor(max_workers=PASSWORD_POOL_WORKERS, thread_name_prefix="bcrypt"),
+        "slots": threading.BoundedSemaphore(PASSWORD_QUEUE_LIMIT),
+    }
+
+def run_password_job(func, *args):
+    """Runs a bcrypt call on the shared pool. Returns None if the queue is full."""
+    pool = get_password_pool()
+    if not pool["slots"].acquire(blocking=False):
+        return None # Too many logins in flight, let the caller ask the user to retry
+    try:
+        return pool["executor"].submit(func, *args).result()
+    finally:
+        pool["slots"].release()
+
+@timed("hash_password")
 def hash_password(password):
-    """Hashes a password using bcrypt."""
-    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt())
+    """Hashes a password using bcrypt (None if the server is too busy)."""
+    return run_password_job(
+        lambda: bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds=BCRYPT_ROUNDS))
+    )
 
+@timed("verify_password")
 def verify_password(stored_hash, provided_password):
-    """Verifies a provided password against a stored bcrypt hash."""
+    """Verifies a provided password against a stored bcrypt hash (None if the server is too busy)."""
+    def check():
+        try:
+            # bcrypt hashes are stored as strings, need to encode back to bytes
+            return bcrypt.checkpw(provided_password.encode('utf-8'), stored_hash.encode('utf-8'))
+        except ValueError: # Handle potential issues with invalid hash format
+            return False
+    return run_password_job(check)
+
+def password_needs_rehash(stored_hash):
+    """Checks whether a stored hash was made with a different work factor than BCRYPT_ROUNDS."""
+    try:
+        # bcrypt hash format: $2b$<cost>$<salt+hash>
+        return int(stored_hash.split("$")[2]) != BCRYPT_ROUNDS
+    except (IndexError, ValueError):
+        return False
+
+def read_student_csv(data):
+    """Parses an uploaded CSV with username and password columns into a list of row dicts."""
+    reader = csv.DictReader(io.StringIO(data.decode('utf-8-sig')))
+    if not {"username", "password"} <= set(reader.fieldnames or ()):
+        raise ValueError("The CSV needs a header row with 'username' and 'password' columns.")
+    return [{"username": (row["username"] or "").strip(), "password": row["password"] or ""} for row in reader]
+
+def existing_usernames(usernames):
+    """Returns which of the usernames are already in the user store."""
+    found = set()
+    usernames = list(usernames)
+    with closing(connect_user_db()) as conn:
+        for start in range(0, len(usernames), IMPORT_BATCH_SIZE): # Stay under SQLite's bound-variable limit
+            batch = usernames[start:start + IMPORT_BATCH_SIZE]
+            placeholders = ",".join("?" * len(batch))
+            found.update(row[0] for row in conn.execute(f"SELECT username FROM users WHERE username IN ({placeholders})", batch))
+    return found
+
+@st.cache_resource
+def get_import_pool():
+    """Worker pool for bulk-import hashing, separate from the login pool so sign-ins stay responsive."""
+    # bcrypt releases the GIL while hashing, so threads use every core
+    return ThreadPoolExecutor(max_workers=IMPORT_HASH_WORKERS, thread_name_prefix="bcrypt-import")
+
+def hash_new_password(password):
+    """bcrypt hash of a password as a string, computed on the calling thread."""
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds=BCRYPT_ROUNDS)).decode('utf-8')
+
+@timed("import_students")
+def import_students(rows, on_progress=None):
+    """Creates users from CSV rows and returns one report row per input row.
+
+    Usernames already in the store are skipped, so re-running an interrupted import
+    resumes it. Passwords are hashed in parallel and each batch commits in one transaction.
+    """
+    report = [None] * len(rows)
+    pending, seen = [], set()
+    for i, row in enumerate(rows):
+        if not row["username"] or not row["password"]:
+            report[i] = (row["username"], "invalid", "Missing username or password.")
+        elif len(row["password"]) < MIN_PASSWORD_LENGTH:
+            report[i] = (row["username"], "invalid", f"Password must be at least {MIN_PASSWORD_LENGTH} characters long.")
+        elif row["username"] in seen:
+            report[i] = (row["username"], "duplicate", "Listed earlier in this file.")
+        else:
+            seen.add(row["username"])
+            pending.append(i)
+    existing = existing_usernames(rows[i]["username"] for i in pending)
+    for i in pending:
+        if rows[i]["username"] in existing:
+            report[i] = (rows[i]["username"], "exists", "Already registered.")
+    pending = [i for i in pending if report[i] is None]
+
+    pool = get_import_pool()
+    for start in range(0, len(pending), IMPORT_BATCH_SIZE):
+        batch = pending[start:start + IMPORT_BATCH_SIZE]
+        hashes = list(pool.map(hash_new_password, (rows[i]["password"] for i in batch)))
+        try:
+            with closing(connect_user_db()) as conn, conn:
+                for i, hashed in zip(batch, hashes):
+                    # OR IGNORE: a student who registered meanwhile keeps their own password
+                    inserted = conn.execute(
+                        "INSERT OR IGNORE INTO users (username, hashed_password) VALUES (?, ?)",
+                        (rows[i]["username"], hashed),
+                    ).rowcount
+                    report[i] = (rows[i]["username"], "created", "") if inserted else (rows[i]["username"], "exists", "Already registered.")
+        except sqlite3.Error as e:
+            for i in pending[start:]:
+                report[i] = (rows[i]["username"], "failed", f"Could not save: {e}")
+            break
+        count_event("imported_student", sum(1 for i in batch if report[i][1] == "created"))
+        if on_progress:
+            on_progress(start + len(batch), len(pending))
+    return report
+
+def import_report_csv(report):
+    """Formats an import report as CSV text for download."""
+    out = io.StringIO()
+    writer = csv.writer(out)
+    writer.writerow(["username", "status", "detail"])
+    writer.writerows(report)
+    return out.getvalue()
+
+def tokenize(text):
+    """Lower-cases text and splits it into word tokens for the search index."""
+    return re.findall(r"\w+", text.lower())
+
+@st.cache_resource
+def get_search_index():
+    """Process-wide inverted index over the syllabus, shared by all sessions."""
+    return {
+        "lock": threading.Lock(),
+        "postings": {}, # token -> {(subject, topic, subtopic): {field: count}}
+        "vocabulary": [], # Sorted tokens, for prefix matching
+        "subject_tokens": {}, # subject -> tokens it contributed, so it can be reindexed alone
+        "pack_versions": {}, # subject -> (pack name, mtime) it was indexed from
+        "doc_count": 0,
+    }
+
+def _index_subject(index, subject, subject_entry):
+    """(Re)indexes one subject's pack. Caller holds the index lock.
+
+    The pack is parsed before the subject's old postings are removed, so a broken
+    pack leaves the previous index (and the vocabulary built from it) intact.
+    """
+    # Read straight from disk: the cached copy may predate the change being indexed
+    pack = read_content_pack(subject_entry["pack"]) if subject_entry is not None else {}
+    postings = index["postings"]
+    for token in index["subject_tokens"].pop(subject, ()):
+        docs = postings[token]
+        for doc in [doc for doc in docs if doc[0] == subject]:
+            del docs[doc]
+            if not docs:
+                del postings[token]
+    if subject_entry is None:
+        return # Subject was removed from the manifest
+    subject_tokens = set()
+    for topic, subtopics in pack.items():
+        for subtopic, body in subtopics.items():
+            fields = {
+                "title": f"{subject} {topic} {subtopic}",
+                "detail": body.get("detail", ""),
+                "notes": body.get("notes", ""),
+                "flashcards": " ".join(f"{card['q']} {card['a']}" for card in body.get("flashcards", [])),
+            }
+            for field, text in fields.items():
+                for token in tokenize(text):
+                    field_counts = postings.setdefault(token, {}).setdefault((subject, topic, subtopic), {})
+                    field_counts[field] = field_counts.get(field, 0) + 1
+                    subject_tokens.add(token)
+    index["subject_tokens"][subject] = subject_tokens
+
+def refresh_search_index():
+    """Reindexes only the subjects whose content pack changed since the last query."""
+    manifest = get_syllabus_manifest()
+    index = get_search_index()
+    with index["lock"]:
+        changed = False
+        for subject in list(index["pack_versions"]):
+            if subject not in manifest:
+                _index_subject(index, subject, None)
+                del index["pack_versions"][subject]
+                changed = True
+        for subject, subject_entry in manifest.items():
+            try:
+                version = (subject_entry["pack"], (CONTENT_DIR / subject_entry["pack"]).stat().st_mtime_ns)
+            except OSError:
+                continue
+            if index["pack_versions"].get(subject) != version:
+                try:
+                    _index_subject(index, subject, subject_entry)
+                except (json.JSONDecodeError, IOError):
+                    logger.warning("Could not index content pack %s", subject_entry["pack"])
+                    continue
+                index["pack_versions"][subject] = version
+                changed = True
+        if changed:
+            index["vocabulary"] = sorted(index["postings"])
+            index["doc_count"] = len({doc for docs in index["postings"].values() for doc in docs})
+    return index
+
+@timed("search_syllabus")
+def search_syllabus(query, limit=SEARCH_MAX_RESULTS):
+    """Ranked full-text search. Every query word must match, as a whole word or a prefix."""
+    terms = tokenize(query)
+    if not terms:
+        return []
+    index = refresh_search_index()
+    with index["lock"]:
+        postings, vocabulary = index["postings"], index["vocabulary"]
+        scores = None
+        field_scores = {}
+        for term in terms:
+            term_scores = {}
+            position = bisect_left(vocabulary, term)
+            end = min(position + SEARCH_MAX_PREFIX_EXPANSIONS, len(vocabulary))
+            while position < end and vocabulary[position].startswith(term):
+                word = vocabulary[position]
+                position += 1
+                idf = math.log(1 + index["doc_count"] / len(postings[word]))
+                boost = 1.0 if word == term else 0.5 # Whole-word matches beat prefix matches
+                for doc, field_counts in postings[word].items():
+                    for field, count in field_counts.items():
+                        weight = SEARCH_FIELD_WEIGHTS[field] * count * idf * boost
+                        term_scores[doc] = term_scores.get(doc, 0.0) + weight
+                        field_scores[doc, field] = field_scores.get((doc, field), 0.0) + weight
+            if scores is None:
+                scores = term_scores
+            else:
+                scores = {doc: scores[doc] + term_scores[doc] for doc in scores.keys() & term_scores.keys()}
+            if not scores:
+                return []
+    results = []
+    for doc, score in heapq.nlargest(limit, scores.items(), key=lambda item: item[1]):
+        # Open the tab where most of the match came from (title matches open the explanation)
+        best_field = max(CONTENT_TABS, key=lambda field: field_scores.get((doc, field), 0.0))
+        results.append({
+            "subject": doc[0],
+            "topic": doc[1],
+            "subtopic": doc[2],
+            "tab": CONTENT_TABS[best_field],
+            "score": score,
+        })
+    return results
+
+def open_subtopic(subject, topic, subtopic, tab=None, card_index=0):
+    """Widget callback: jumps straight to a subtopic (and optionally a tab and flashcard)."""
+    update_study_time() # Stop timer for previous content
+    release_tts_jobs() # Stop generating audio for the page being left
+    st.session_state.review_deck = None # Leave mixed review
+    st.session_state.current_subject = subject
+    st.session_state.current_topic = topic
+    st.session_state.current_subtopic = subtopic
+    st.session_state.flashcard_index = card_index
+    st.session_state.flashcard_side = 'q'
+    st.session_state.study_start_time = time.time() # Start timer for new content
+    st.session_state.open_tab = tab
+    # Let the sidebar selectors re-initialise from the new selection
+    for key in ("subject_selector", "topic_selector", "subtopic_selector"):
+        st.session_state.pop(key, None)
+
+def flashcard_id(subject, topic, subtopic, card):
+    """Stable id for a flashcard, so its schedule survives cards being added or reordered."""
+    return hashlib.sha256(json.dumps([subject, topic, subtopic, card["q"]]).encode('utf-8')).hexdigest()[:16]
+
+def sm2_update(ease, interval_days, repetitions, quality):
+    """Applies one SM-2 review. Returns (ease, interval_days, repetitions) after the review."""
+    if quality < SRS_PASS_QUALITY:
+        # Forgotten: start the card over (it comes back after SRS_AGAIN_DELAY_SECONDS)
+        return max(SRS_MIN_EASE, ease - 0.2), 0.0, 0
+    repetitions += 1
+    if repetitions == 1:
+        interval_days = 1.0
+    elif repetitions == 2:
+        interval_days = 6.0
+    else:
+        interval_days = round(interval_days * ease)
+    ease = max(SRS_MIN_EASE, ease + 0.1 - (5 - quality) * (0.08 + (5 - quality) * 0.02))
+    return ease, interval_days, repetitions
+
+def record_flashcard_review(username, subject, topic, subtopic, card_index, card, quality):
+    """Logs a graded review and reschedules the card. Returns False if it couldn't be saved."""
+    card_id = flashcard_id(subject, topic, subtopic, card)
+    now = time.time()
     try:
-        # bcrypt hashes are stored as strings, need to encode back to bytes
-        return bcrypt.checkpw(provided_password.encode('utf-8'), stored_hash.encode('utf-8'))
-    except ValueError: # Handle potential issues with invalid hash format
+        with closing(connect_user_db()) as conn, conn:
+            row = conn.execute(
+                "SELECT ease, interval_days, repetitions FROM card_schedule WHERE username = ? AND card_id = ?",
+                (username, card_id),
+            ).fetchone()
+            ease, interval_days, repetitions = sm2_update(*(row or (SRS_DEFAULT_EASE, 0.0, 0)), quality)
+            due_at = now + (interval_days * 86400 if repetitions else SRS_AGAIN_DELAY_SECONDS)
+            conn.execute(
+                "INSERT INTO card_reviews (username, card_id, reviewed_at, grade) VALUES (?, ?, ?, ?)",
+                (username, card_id, now, quality),
+            )
+            conn.execute(
+                "INSERT INTO card_schedule (username, card_id, subject, topic, subtopic, card_index, "
+                "ease, interval_days, repetitions, due_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(username, card_id) DO UPDATE SET "
+                "subject = excluded.subject, topic = excluded.topic, subtopic = excluded.subtopic, "
+                "card_index = excluded.card_index, ease = excluded.ease, interval_days = excluded.interval_days, "
+                "repetitions = excluded.repetitions, due_at = excluded.due_at",
+                (username, card_id, subject, topic, subtopic, card_index, ease, interval_days, repetitions, due_at),
+            )
+        return True
+    except sqlite3.Error:
+        st.error("Could not save your flashcard review.")
         return False
 
-def generate_tts_audio(text):
-    """Generates TTS audio bytes using gTTS."""
+@timed("get_due_flashcards")
+def get_due_flashcards(username, limit=1):
+    """Returns up to limit (subject, topic, subtopic, card_index, card_id) tuples, most overdue first."""
+    try:
+        with closing(connect_user_db()) as conn:
+            return conn.execute(
+                "SELECT subject, topic, subtopic, card_index, card_id FROM card_schedule "
+                "WHERE username = ? AND due_at <= ? ORDER BY due_at LIMIT ?",
+                (username, time.time(), limit),
+            ).fetchall()
+    except sqlite3.Error:
+        return []
+
+@timed("count_due_flashcards")
+def count_due_flashcards(username):
+    """Counts the user's flashcards that are due for review now."""
     try:
-        tts = gTTS(text=text, lang='en', slow=False)
-        audio_fp = io.BytesIO()
-        tts.write_to_fp(audio_fp)
-        audio_fp.seek(0) # Rewind file pointer
-        return audio_fp.read()
-    except Exception as e:
-        st.error(f"Failed to generate audio: {e}")
+        with closing(connect_user_db()) as conn:
+            return conn.execute(
+                "SELECT COUNT(*) FROM card_schedule WHERE username = ? AND due_at <= ?",
+                (username, time.time()),
+            ).fetchone()[0]
+    except sqlite3.Error:
+        return 0
+
+def drop_flashcard_schedules(username, card_ids):
+    """Deletes schedule rows for cards that no longer exist. Returns False if they couldn't be deleted."""
+    try:
+        with closing(connect_user_db()) as conn, conn:
+            conn.executemany(
+                "DELETE FROM card_schedule WHERE username = ? AND card_id = ?",
+                [(username, card_id) for card_id in card_ids],
+            )
+        return True
+    except sqlite3.Error:
+        return False
+
+def open_next_due_flashcard():
+    """Button callback: opens the user's most overdue flashcard that is still in the syllabus."""
+    username = st.session_state.username
+    index = get_card_index()
+    while True:
+        due = get_due_flashcards(username, limit=SRS_DUE_BATCH)
+        stale = []
+        for subject, topic, subtopic, _, card_id in due:
+            position = index["card_position"].get(card_id)
+            if position is None:
+                # Removed, or its question was edited. Unless its pack just couldn't be read: keep those
+                if subject in index["indexed_subjects"]:
+                    stale.append(card_id)
+                continue
+            drop_flashcard_schedules(username, stale)
+            # Cards may have moved within the subtopic since they were scheduled
+            card_index = int(index["card_offset"][position])
+            open_subtopic(subject, topic, subtopic, tab=CONTENT_TABS["flashcards"], card_index=card_index)
+            return
+        if not stale or not drop_flashcard_schedules(username, stale):
+            return # Nothing due, or the stale rows would come back on every fetch
+
+def syllabus_version():
+    """Version of the whole syllabus: the manifest's mtime plus every pack's."""
+    manifest = get_syllabus_manifest()
+    return (content_file_version("manifest.json"),) + tuple(content_file_version(entry["pack"]) for entry in manifest.values())
+
+@st.cache_resource(max_entries=2)
+def build_card_index(version):
+    """Flat arrays over every flashcard in the syllabus (once per syllabus version).
+
+    Card i is flashcard card_offset[i] of subtopics[card_subtopic[i]], so drawing cards
+    is array work and never walks the nested syllabus.
+    """
+    manifest = load_syllabus_manifest(version[0])
+    subjects = list(manifest)
+    subtopics, card_subject, card_subtopic, card_offset, card_ids = [], [], [], [], []
+    indexed_subjects = set()
+    for subject_pos, (subject, subject_entry) in enumerate(manifest.items()):
+        try:
+            pack = read_content_pack(subject_entry["pack"])
+        except (json.JSONDecodeError, IOError):
+            logger.warning("Could not index flashcards in %s", subject_entry["pack"])
+            continue
+        indexed_subjects.add(subject)
+        for topic, topic_subtopics in subject_entry["topics"].items():
+            for subtopic in topic_subtopics:
+                flashcards = pack.get(topic, {}).get(subtopic, {}).get("flashcards", [])
+                for offset, card in enumerate(flashcards):
+                    card_subject.append(subject_pos)
+                    card_subtopic.append(len(subtopics))
+                    card_offset.append(offset)
+                    card_ids.append(flashcard_id(subject, topic, subtopic, card))
+                subtopics.append((subject, topic, subtopic))
+    return {
+        "subjects": subjects,
+        "subject_index": {subject: i for i, subject in enumerate(subjects)},
+        "subtopics": subtopics, # (subject, topic, subtopic) per position
+        "card_subject": np.array(card_subject, dtype=np.int32),
+        "card_subtopic": np.array(card_subtopic, dtype=np.int32),
+        "card_offset": np.array(card_offset, dtype=np.int32),
+        "card_position": {card_id: i for i, card_id in enumerate(card_ids)},
+        "indexed_subjects": indexed_subjects, # Subjects whose pack could be read
+    }
+
+def get_card_index():
+    """Returns the shared flashcard index for the current syllabus."""
+    return build_card_index(syllabus_version())
+
+def load_miss_counts(username, card_index):
+    """Returns per-card (reviews, misses) arrays aligned with the card index, from the review log."""
+    reviews = np.zeros(len(card_index["card_offset"]), dtype=np.int32)
+    misses = np.zeros_like(reviews)
+    try:
+        with closing(connect_user_db()) as conn:
+            rows = conn.execute(
+                "SELECT card_id, COUNT(*), SUM(grade < ?) FROM card_reviews WHERE username = ? GROUP BY card_id",
+                (SRS_PASS_QUALITY, username),
+            ).fetchall()
+    except sqlite3.Error:
+        return reviews, misses
+    positions, review_counts, miss_counts = [], [], []
+    for card_id, review_count, miss_count in rows:
+        position = card_index["card_position"].get(card_id)
+        if position is not None: # Reviews of cards since removed from the syllabus are ignored
+            positions.append(position)
+            review_counts.append(review_count)
+            miss_counts.append(miss_count)
+    reviews[positions] = review_counts
+    misses[positions] = miss_counts
+    return reviews, misses
+
+@timed("draw_review_cards")
+def draw_review_cards(username, subjects, count, weak_first=False):
+    """Samples up to count distinct flashcards from the given subjects (all if empty).
+
+    With weak_first, cards are drawn in proportion to the student's smoothed miss rate,
+    so unseen cards come up less often than missed ones and more than mastered ones.
+    Returns (subject, topic, subtopic, card_index) tuples in random order.
+    """
+    card_index = get_card_index()
+    if subjects:
+        wanted = [card_index["subject_index"][subject] for subject in subjects if subject in card_index["subject_index"]]
+        candidates = np.flatnonzero(np.isin(card_index["card_subject"], wanted))
+    else:
+        candidates = np.arange(len(card_index["card_offset"]))
+    count = min(count, candidates.size)
+    if count == 0:
+        return []
+    rng = np.random.default_rng()
+    if weak_first:
+        reviews, misses = load_miss_counts(username, card_index)
+        weights = (misses[candidates] + 1) / (reviews[candidates] + 2)
+        # Efraimidis-Spirakis: the count largest u^(1/w) keys are a weighted sample without replacement
+        keys = np.log(rng.random(candidates.size)) / weights
+    else:
+        keys = rng.random(candidates.size)
+    chosen = candidates[np.argpartition(-keys, count - 1)[:count]]
+    rng.shuffle(chosen)
+    return [
+        (*card_index["subtopics"][card_index["card_subtopic"][position]], int(card_index["card_offset"][position]))
+        for position in chosen
+    ]
+
+def synthesize_gtts(text, lang, slow):
+    """Synthesizes speech with Google TTS (needs network access)."""
+    tts = gTTS(text=text, lang=lang, slow=slow)
+    audio_fp = io.BytesIO()
+    tts.write_to_fp(audio_fp)
+    return audio_fp.getvalue()
+
+def synthesize_stub(text, lang, slow):
+    """Offline stand-in backend for tests and benchmarks. Returns placeholder bytes, not real audio."""
+    if TTS_STUB_DELAY_SECONDS or TTS_STUB_CHAR_DELAY_SECONDS:
+        time.sleep(TTS_STUB_DELAY_SECONDS + TTS_STUB_CHAR_DELAY_SECONDS * len(text))
+    return f"{lang}|{slow}|{text}".encode('utf-8')
+
+# A backend is any callable (text, lang, slow) -> audio bytes. Register offline engines here.
+TTS_BACKENDS = {
+    "gtts": synthesize_gtts,
+    "stub": synthesize_stub,
+}
+
+def tts_cache_key(text, lang, slow, backend):
+    """Content hash identifying one synthesized clip."""
+    return hashlib.sha256(json.dumps([text, lang, slow, backend]).encode('utf-8')).hexdigest()
+
+@st.cache_resource
+def get_tts_cache():
+    """Process-wide TTS cache state: hit/miss counters for the clip store.
+
+    Clips live only on disk. Pages play them by URL, so no audio bytes are held in memory.
+    """
+    TTS_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    return {
+        "lock": threading.Lock(),
+        "hits": 0,
+        "misses": 0,
+    }
+
+def tts_cache_path(key):
+    """Where the clip with this key is stored."""
+    return TTS_CACHE_DIR / f"{key}.mp3"
+
+def _count_tts_lookup(hit):
+    """Counts a store lookup for the metrics export."""
+    cache = get_tts_cache()
+    with cache["lock"]:
+        cache["hits" if hit else "misses"] += 1
+
+def tts_cache_put(key, audio):
+    """Stores a clip and trims the store to TTS_DISK_CACHE_MAX_BYTES."""
+    get_tts_cache() # Creates the store directory
+    audio_path = tts_cache_path(key)
+    tmp_path = audio_path.with_suffix(f".{threading.get_ident()}.tmp")
+    try:
+        tmp_path.write_bytes(audio)
+        os.replace(tmp_path, audio_path) # Atomic, so readers never see half a clip
+    except OSError:
+        logger.warning("Could not write TTS cache file %s", audio_path.name)
+        return
+    evict_tts_disk_cache()
+
+def evict_tts_disk_cache():
+    """Deletes the least recently used clips until the store fits its size cap."""
+    clips = []
+    for audio_path in TTS_CACHE_DIR.glob("*.mp3"):
+        try:
+            stat = audio_path.stat()
+        except OSError:
+            continue # Removed by another session meanwhile
+        clips.append((stat.st_mtime, stat.st_size, audio_path))
+    total_bytes = sum(size for _, size, _ in clips)
+    for _, size, audio_path in sorted(clips):
+        if total_bytes <= TTS_DISK_CACHE_MAX_BYTES:
+            break
+        audio_path.unlink(missing_ok=True)
+        total_bytes -= size
+
+def store_tts_clip(text, lang='en', slow=False):
+    """Makes sure the clip for text is in the store, synthesizing it on a miss. Returns its key."""
+    key = tts_cache_key(text, lang, slow, TTS_BACKEND)
+    audio_path = tts_cache_path(key)
+    try:
+        os.utime(audio_path) # A hit: touch it (so eviction drops the least recently used clips) without reading it
+        _count_tts_lookup(True)
+        return key
+    except OSError:
+        _count_tts_lookup(False)
+    with timed("tts_synthesize"):
+        audio = TTS_BACKENDS[TTS_BACKEND](text, lang, slow)
+    tts_cache_put(key, audio)
+    return key
+
+def tts_audio_source(key):
+    """What st.audio should play for a stored clip.
+
+    In a browser session that's the clip's static URL, so the server streams the file
+    (with range requests for seeking) instead of copying it into the media store.
+    Elsewhere (AppTest, static serving off, or a store moved out of static/) it falls
+    back to the file path.
+    """
+    if TTS_CACHE_DIR == TTS_STATIC_DIR and st.context.url and st.get_option("server.enableStaticServing"):
+        return urljoin(st.context.url, TTS_STATIC_URL_PATH + tts_cache_path(key).name)
+    return tts_cache_path(key)
+
+def split_tts_text(text, max_chars=TTS_CHUNK_CHARS):
+    """Splits text into chunks of at most ~max_chars at markdown block and sentence boundaries."""
+    pieces = []
+    for line in text.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        if len(line) > max_chars:
+            pieces.extend(sentence for sentence in re.split(r"(?<=[.!?])\s+", line) if sentence)
+        else:
+            pieces.append(line)
+    # Pack the pieces back together so short bullet points don't each cost a request
+    chunks, current = [], ""
+    for piece in pieces:
+        if current and len(current) + 1 + len(piece) > max_chars:
+            chunks.append(current)
+            current = piece
+        else:
+            current = f"{current}\n{piece}" if current else piece
+    if current:
+        chunks.append(current)
+    return chunks
+
+@st.cache_resource
+def get_tts_pool():
+    """Shared bounded worker pool for TTS synthesis (one per process, shared by all sessions)."""
+    return ThreadPoolExecutor(max_workers=TTS_POOL_WORKERS, thread_name_prefix="tts")
+
+def prewarm_tts_cache(report=None):
+    """Synthesizes every detail/notes text in the syllabus so the first student gets a cache hit.
+
+    Walks the manifest and reads only the compiled speech texts. Calls report(subject, texts, clips)
+    with the running totals after each subject. Returns (texts, clips, failed texts).
+    """
+    pool = get_tts_pool()
+    texts = clips = failures = 0
+    for subject, subject_entry in get_syllabus_manifest().items():
+        for topic, subtopics in subject_entry["topics"].items():
+            for subtopic in subtopics:
+                for field, compiled in load_compiled_subtopic(subject, topic, subtopic).items():
+                    if compiled:
+                        try:
+                            # Same clips a Read Aloud job makes, written straight to the store
+                            clips += sum(1 for _ in pool.map(store_tts_clip, split_tts_text(compiled)))
+                            texts += 1
+                        except Exception:
+                            failures += 1
+                            logger.exception("TTS pre-warm failed for a %s text", field)
+        if report is not None:
+            report(subject, texts, clips)
+    logger.info("TTS pre-warm finished: %d texts, %d clips, %d failed", texts, clips, failures)
+    return texts, clips, failures
+
+@st.cache_resource
+def start_tts_prewarm():
+    """Starts pre-warming the TTS cache in the background (once per process)."""
+    thread = threading.Thread(target=prewarm_tts_cache, name="tts-prewarm", daemon=True)
+    thread.start()
+    return thread
+
+def prewarm_tts_command():
+    """`--prewarm-tts`: pre-warms the TTS cache with progress on stdout, then exits (status 1 if a text failed)."""
+    started = time.perf_counter()
+    texts, clips, failures = prewarm_tts_cache(
+        report=lambda subject, texts, clips: print(f"{subject}: {texts} texts, {clips} clips so far", flush=True)
+    )
+    print(f"TTS cache pre-warmed in {time.perf_counter() - started:.1f} s: {texts} texts, {clips} clips in {TTS_CACHE_DIR}, {failures} failed")
+    sys.exit(1 if failures else 0)
+
+def current_session_id():
+    """Id of the browser session this script run belongs to (None outside a script run)."""
+    ctx = get_script_run_ctx()
+    return ctx.session_id if ctx else None
+
+@st.cache_resource
+def get_tts_jobs():
+    """Process-wide Read Aloud job registry, keyed by the clip's content hash so sessions share jobs."""
+    return {
+        "jobs": {}, # job key -> job dict
+        "lock": threading.RLock(), # Re-entrant: futures that are already done run their callback on add
+    }
+
+def _finish_tts_chunk(registry, job, index, future):
+    """Pool callback: marks one chunk of a job ready, or fails the whole job."""
+    with registry["lock"]:
+        if future.cancelled() or job["status"] != "running":
+            return
+        error = future.exception()
+        if error is not None:
+            job["status"] = "failed"
+            job["error"] = str(error)
+            job["finished_at"] = time.time()
+            for other in job["futures"]:
+                other.cancel()
+            return
+        job["ready"][index] = True
+        if index == 0:
+            observe_span("tts_first_audio", time.perf_counter() - job["started"]) # Playback starts once part 1 is ready
+        if all(job["ready"]):
+            job["status"] = "done"
+            job["finished_at"] = time.time()
+            observe_span("generate_tts_audio", time.perf_counter() - job["started"]) # Whole text, click to last clip
+
+def _prune_tts_jobs(registry):
+    """Drops finished jobs older than TTS_JOB_RETENTION_SECONDS. Caller holds the lock."""
+    cutoff = time.time() - TTS_JOB_RETENTION_SECONDS
+    for key, job in list(registry["jobs"].items()):
+        if job["status"] != "running" and job["finished_at"] < cutoff:
+            del registry["jobs"][key]
+
+def submit_tts_job(text, session_id, lang='en', slow=False):
+    """Queues text for synthesis on the shared pool and returns its job.
+
+    An identical job already queued or finished is shared instead of started again,
+    unless it finished and some of its clips have since been evicted from the store.
+    Returns None when TTS_MAX_ACTIVE_JOBS are already running.
+    """
+    chunks = split_tts_text(text)
+    key = tts_cache_key(text, lang, slow, TTS_BACKEND)
+    registry = get_tts_jobs()
+    with registry["lock"]:
+        job = registry["jobs"].get(key)
+        if job is not None and job["status"] == "done" and not all(tts_cache_path(clip).exists() for clip in job["clip_keys"]):
+            del registry["jobs"][key] # Synthesize the evicted clips again; waiting sessions pick up the new job by key
+            count_event("tts_job_expired")
+            job = None
+        if job is not None and job["status"] in ("running", "done"):
+            job["sessions"].add(session_id)
+            count_event("tts_job_shared")
+            return job
+        _prune_tts_jobs(registry)
+        if sum(1 for other in registry["jobs"].values() if other["status"] == "running") >= TTS_MAX_ACTIVE_JOBS:
+            count_event("tts_job_rejected")
+            return None
+        job = {
+            "key": key,
+            "chunks": chunks,
+            "clip_keys": [tts_cache_key(chunk, lang, slow, TTS_BACKEND) for chunk in chunks],
+            "lang": lang,
+            "slow": slow,
+            "ready": [False] * len(chunks),
+            "status": "running" if chunks else "failed", # "running", "done", "failed" or "cancelled"
+            "error": None if chunks else "Nothing to read.",
+            "sessions": {session_id},
+            "futures": [],
+            "started": time.perf_counter(),
+            "finished_at": None if chunks else time.time(),
+        }
+        registry["jobs"][key] = job
+        count_event("tts_job_started")
+        pool = get_tts_pool()
+        for i, chunk in enumerate(chunks):
+            future = pool.submit(store_tts_clip, chunk, lang, slow)
+            job["futures"].append(future)
+            future.add_done_callback(functools.partial(_finish_tts_chunk, registry, job, i))
+    return job
+
+def get_tts_job(key):
+    """Returns the job with this key, or None if it was released or pruned."""
+    if key is None:
         return None
+    registry = get_tts_jobs()
+    with registry["lock"]:
+        return registry["jobs"].get(key)
+
+def release_tts_jobs():
+    """Detaches this session from its Read Aloud jobs, cancelling queued chunks nobody else is waiting for."""
+    session_id = current_session_id()
+    registry = get_tts_jobs()
+    with registry["lock"]:
+        for key in st.session_state.pop("tts_jobs", {}).values():
+            job = registry["jobs"].get(key)
+            if job is None:
+                continue
+            job["sessions"].discard(session_id)
+            if job["sessions"]:
+                continue
+            if job["status"] == "running":
+                job["status"] = "cancelled"
+                job["finished_at"] = time.time()
+                for future in job["futures"]:
+                    future.cancel() # Chunks already synthesizing finish and still land in the cache
+                count_event("tts_job_cancelled")
+            del registry["jobs"][key]
+
+def save_study_events(username, events):
+    """Appends events to the user's study log and updates the rollups in one transaction."""
+    rollups = {}
+    total_seconds, total_flips = 0.0, 0
+    for event in events:
+        seconds = event["ended_at"] - event["started_at"] if event["kind"] == "view" else 0.0
+        flips = 1 if event["kind"] == "flip" else 0
+        day = time.strftime("%Y-%m-%d", time.localtime(event["started_at"]))
+        rollup_key = (event["subject"] or "", event["topic"] or "", event["subtopic"] or "", day)
+        rollup_seconds, rollup_flips = rollups.get(rollup_key, (0.0, 0))
+        rollups[rollup_key] = (rollup_seconds + seconds, rollup_flips + flips)
+        total_seconds += seconds
+        total_flips += flips
+    try:
+        # A crash mid-batch rolls the whole transaction back, so the log and rollups never disagree
+        with closing(connect_user_db()) as conn, conn:
+            conn.executemany(
+                "INSERT INTO study_events (username, kind, subject, topic, subtopic, started_at, ended_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(username, e["kind"], e["subject"], e["topic"], e["subtopic"], e["started_at"], e["ended_at"]) for e in events],
+            )
+            conn.executemany(
+                "INSERT INTO study_rollups (username, subject, topic, subtopic, day, seconds, flips) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(username, subject, topic, subtopic, day) DO UPDATE SET "
+                "seconds = seconds + excluded.seconds, flips = flips + excluded.flips",
+                [(username, *rollup_key, seconds, flips) for rollup_key, (seconds, flips) in rollups.items()],
+            )
+            conn.execute(
+                "INSERT INTO study_totals (username, seconds, flips) VALUES (?, ?, ?) "
+                "ON CONFLICT(username) DO UPDATE SET "
+                "seconds = seconds + excluded.seconds, flips = flips + excluded.flips",
+                (username, total_seconds, total_flips),
+            )
+        return True
+    except sqlite3.Error:
+        logger.warning("Could not save %d study events for %s", len(events), username)
+        return False
+
+def load_study_total(username):
+    """Returns the user's total recorded study time in seconds, from the precomputed totals."""
+    try:
+        with closing(connect_user_db()) as conn:
+            row = conn.execute("SELECT seconds FROM study_totals WHERE username = ?", (username,)).fetchone()
+    except sqlite3.Error:
+        return 0.0
+    return row[0] if row else 0.0
+
+def flush_study_events(force=False):
+    """Writes buffered study events once the batch is big or old enough (or when forced)."""
+    buffer = st.session_state.get("study_event_buffer")
+    if not buffer:
+        return
+    now = time.time()
+    if not force and len(buffer) < STUDY_EVENT_BATCH_SIZE and now - st.session_state.study_events_flushed_at < STUDY_EVENT_FLUSH_SECONDS:
+        return
+    # Each event is saved under the user it was logged for (a failed logout flush can leave
+    # another user's events in this session's buffer)
+    by_user = {}
+    for event in buffer:
+        by_user.setdefault(event["username"], []).append(event)
+    st.session_state.study_event_buffer = [
+        event for username, events in by_user.items() if not save_study_events(username, events) for event in events
+    ]
+    st.session_state.study_events_flushed_at = now # On failure, retry at the next interval
+
+def log_study_event(kind, started_at, ended_at=None, location=None):
+    """Buffers a study event ("view" or "flip") for location, a (subject, topic, subtopic), or the current subtopic."""
+    subject, topic, subtopic = location or (
+        st.session_state.current_subject, st.session_state.current_topic, st.session_state.current_subtopic
+    )
+    st.session_state.setdefault("study_event_buffer", []).append({
+        "username": st.session_state.username,
+        "kind": kind,
+        "subject": subject,
+        "topic": topic,
+        "subtopic": subtopic,
+        "started_at": started_at,
+        "ended_at": started_at if ended_at is None else ended_at,
+    })
+    flush_study_events()
 
 def update_study_time(start_time_key="study_start_time"):
-    """Calculates elapsed time and adds to total, resets start time."""
+    """Calculates elapsed time, adds it to the total and the study log, resets start time."""
     if st.session_state.get(start_time_key) is not None:
-        elapsed = time.time() - st.session_state[start_time_key]
+        now = time.time()
+        elapsed = now - st.session_state[start_time_key]
         st.session_state.total_study_time += elapsed
+        log_study_event("view", st.session_state[start_time_key], now)
         # Reset start time so it's not counted multiple times on reruns
         st.session_state[start_time_key] = None
 
-# --- Initialize Session State ---
-if 'logged_in' not in st.session_state:
-    st.session_state.logged_in = False
-    st.session_state.username = None
-    st.session_state.current_subject = None
-    st.session_state.current_topic = None
+def log_rerun_allocations(start_snapshot, limit=15):
+    """Logs the lines of this script still holding memory allocated during the rerun, plus the peak."""
+    script_filter = [tracemalloc.Filter(True, __file__)]
+    end_snapshot = tracemalloc.take_snapshot().filter_traces(script_filter)
+    stats = end_snapshot.compare_to(start_snapshot.filter_traces(script_filter), "lineno")
+    lines = [str(stat) for stat in stats[:limit] if stat.size_diff > 0]
+    _, peak = tracemalloc.get_traced_memory()
+    logger.info(
+        "Rerun peak traced memory %.1f KiB; allocations kept by this script:\n%s",
+        peak / 1024,
+        "\n".join(lines) or "(none)",
+    )
+
+# --- Navigation Callbacks ---
+# Widgets update session state in on_change/on_click callbacks, which run before the
+# script does, so a click costs one script pass instead of a pass plus st.rerun().
+
+def select_subject():
+    """Subject radio callback: switches subject and resets the lower levels."""
+    update_study_time() # Stop timer for previous content
+    release_tts_jobs() # Stop generating audio for the page being left
+    st.session_state.review_deck = None # Leave mixed review
+    st.session_state.current_subject = st.session_state.subject_selector
+    st.session_state.current_topic = None # Reset lower levels
     st.session_state.current_subtopic = None
     st.session_state.flashcard_index = 0
-    st.session_state.flashcard_side = 'q' # 'q' for question, 'a' for answer
-    st.session_state.total_study_time = 0.0
+    # Let the topic/subtopic selectors re-initialise for the new subject
+    for key in ("topic_selector", "subtopic_selector"):
+        st.session_state.pop(key, None)
+
+def select_topic():
+    """Topic selectbox callback: switches topic and resets the subtopic."""
+    update_study_time() # Stop timer
+    release_tts_jobs() # Stop generating audio for the page being left
+    st.session_state.review_deck = None # Leave mixed review
+    st.session_state.current_topic = st.session_state.topic_selector
+    st.session_state.current_subtopic = None # Reset subtopic
+    st.session_state.flashcard_index = 0
+    st.session_state.pop("subtopic_selector", None)
+
+def select_subtopic():
+    """Subtopic radio callback: switches subtopic and starts its study timer."""
+    update_study_time() # Stop timer
+    release_tts_jobs() # Stop generating audio for the page being left
+    st.session_state.review_deck = None # Leave mixed review
+    st.session_state.current_subtopic = st.session_state.subtopic_selector
+    st.session_state.flashcard_index = 0
+    st.session_state.flashcard_side = 'q'
+    st.session_state.open_tab = None
+    st.session_state.study_start_time = time.time() # Start timer for new content
+
+def log_in():
+    """Login form callback: checks credentials and starts the session, so no st.rerun() is needed."""
+    login_username = st.session_state.login_user
+    login_password = st.session_state.login_pass
+    stored_hash = load_user_data(login_username)
+    password_ok = verify_password(stored_hash, login_password) if stored_hash is not None else False
+    if password_ok is None:
+        st.session_state.login_message = ("warning", "The server is busy right now. Please try again in a moment.")
+        return
+    if not password_ok:
+        st.session_state.login_message = ("error", "Incorrect username or password.")
+        return
+    # Transparently upgrade hashes made with an old work factor
+    if password_needs_rehash(stored_hash):
+        new_hash = hash_password(login_password)
+        if new_hash is not None:
+            save_user_data(login_username, new_hash)
+    count_event("login")
+    st.session_state.logged_in = True
+    st.session_state.username = login_username
     st.session_state.last_interaction_time = time.time()
-    st.session_state.study_start_time = None # When user starts viewing specific content
-
-
-# --- Login/Registration Logic ---
-if not st.session_state.logged_in:
-    st.set_page_config(page_title="O-Level Study Hub - Login", layout="centered")
-    st.title("📚 O-Level Study Hub")
-    st.write("Welcome! Please log in or register.")
-
-    users = load_user_data()
-    login_tab, register_tab = st.tabs(["Login", "Register"])
-
-    with login_tab:
-        with st.form("login_form"):
-            login_username = st.text_input("Username", key="login_user")
-            login_password = st.text_input("Password", type="password", key="login_pass")
-            login_button = st.form_submit_button("Login")
-
-            if login_button:
-                if login_username in users and verify_password(users[login_username], login_password):
-                    st.session_state.logged_in = True
-                    st.session_state.username = login_username
-                    st.session_state.last_interaction_time = time.time()
-                    st.session_state.total_study_time = 0.0 # Reset study time on login
-                    st.success("Login successful!")
-                    st.rerun() # Rerun to show the main app
-                else:
-                    st.error("Incorrect username or password.")
-
-    with register_tab:
-         with st.form("register_form"):
-            reg_username = st.text_input("Choose Username", key="reg_user")
-            reg_password = st.text_input("Choose Password", type="password", key="reg_pass")
-            reg_password_confirm = st.text_input("Confirm Password", type="password", key="reg_pass_confirm")
-            register_button = st.form_submit_button("Register")
-
-            if register_button:
-                if not reg_username or not reg_password:
-                    st.warning("Please enter both username and password.")
-                elif reg_password != reg_password_confirm:
-                    st.warning("Passwords do not match.")
-                elif reg_username in users:
-                    st.warning("Username already exists.")
-                elif len(reg_password) < 6:
-                     st.warning("Password must be at least 6 characters long.")
-                else:
-                    hashed = hash_password(reg_password)
-                    if save_user_data(reg_username, hashed):
-                        st.success(f"User '{reg_username}' registered successfully! Please log in.")
-                        # Optionally clear form or switch tab
+    st.session_state.current_subject = None # Start navigation fresh (logout clears these)
+    st.session_state.current_topic = None
+    st.session_state.current_subtopic = None
+    st.session_state.flashcard_index = 0
+    st.session_state.flashcard_side = 'q'
+    st.session_state.study_start_time = None
+    st.session_state.study_events_flushed_at = time.time()
+    flush_study_events(force=True) # Retries events a failed logout flush left behind, under their own user
+    # Seed from the precomputed total; this session's time is added on top
+    st.session_state.total_study_time = load_study_total(login_username)
+
+def log_out():
+    """Logout button callback: records study time and clears the session."""
+    update_study_time() # Record time before logging out
+    flush_study_events(force=True) # Save progress before logging out
+    release_tts_jobs()
+    st.session_state.logged_in = False
+    st.session_state.username = None
+    # Clear sensitive session state keys
+    keys_to_clear = ['current_subject', 'current_topic', 'current_subtopic', 'flashcard_index', 'flashcard_side', 'study_start_time', 'import_report', 'import_summary', 'review_deck']
+    for key in keys_to_clear:
+         if key in st.session_state:
+             del st.session_state[key]
+
+def step_flashcard(step):
+    """Previous/Next callback."""
+    st.session_state.flashcard_index += step
+    st.session_state.flashcard_side = 'q' # Reset to question
+
+def flip_flashcard():
+    """Flip callback: toggles question/answer and logs the flip."""
+    st.session_state.flashcard_side = 'a' if st.session_state.flashcard_side == 'q' else 'q'
+    log_study_event("flip", time.time())
+
+def grade_flashcard(card_index, card, quality, card_count):
+    """Again/Good/Easy callback: schedules the card and moves on to the next one."""
+    if record_flashcard_review(
+        st.session_state.username,
+        st.session_state.current_subject,
+        st.session_state.current_topic,
+        st.session_state.current_subtopic,
+        card_index,
+        card,
+        quality,
+    ):
+        if card_index < card_count - 1:
+            st.session_state.flashcard_index += 1
+        st.session_state.flashcard_side = 'q'
+
+def start_mixed_review():
+    """Mixed Review button callback: draws a deck of cards across topics and switches to it."""
+    deck = draw_review_cards(
+        st.session_state.username,
+        st.session_state.review_subjects,
+        st.session_state.review_size,
+        st.session_state.review_weak_first,
+    )
+    if not deck:
+        st.session_state.review_message = "No flashcards match those subjects yet."
+        return
+    update_study_time() # Stop timer for the subtopic being left
+    release_tts_jobs()
+    st.session_state.review_deck = deck
+    st.session_state.review_position = 0
+    st.session_state.review_side = 'q'
+
+def end_mixed_review():
+    """End Review callback: goes back to the subtopic that was open before."""
+    st.session_state.review_deck = None
+    if st.session_state.current_subtopic:
+        st.session_state.study_start_time = time.time() # Restart its timer
+
+def step_review_card(step):
+    """Mixed review Previous/Next callback."""
+    st.session_state.review_position += step
+    st.session_state.review_side = 'q'
+
+def flip_review_card(subject, topic, subtopic):
+    """Mixed review flip callback: toggles the card and logs the flip under the card's own subtopic."""
+    st.session_state.review_side = 'a' if st.session_state.review_side == 'q' else 'q'
+    log_study_event("flip", time.time(), location=(subject, topic, subtopic))
+
+def grade_review_card(subject, topic, subtopic, card_index, card, quality):
+    """Mixed review grade callback: schedules the card under its own subtopic and moves on."""
+    if record_flashcard_review(st.session_state.username, subject, topic, subtopic, card_index, card, quality):
+        if st.session_state.review_position < len(st.session_state.review_deck) - 1:
+            st.session_state.review_position += 1
+        st.session_state.review_side = 'q'
+
+@st.fragment
+def render_flashcards(flashcards):
+    """Flashcard viewer. Runs as a fragment so paging, flipping and grading only redraw the card area."""
+    # The deck may have shrunk since the index was set
+    card_index = st.session_state.flashcard_index = min(st.session_state.flashcard_index, len(flashcards) - 1)
+    current_card = flashcards[card_index]
+
+    # Display current card (Question or Answer)
+    st.subheader(f"Flashcard {card_index + 1} / {len(flashcards)}")
+    card_container = st.container() # To redraw card content easily
+    with card_container:
+         if st.session_state.flashcard_side == 'q':
+             st.markdown(f"**Question:**\n> {current_card['q']}")
+         else:
+             st.markdown(f"**Answer:**\n> {current_card['a']}")
+
+    # Flashcard Controls
+    fc_col1, fc_col2, fc_col3 = st.columns(3)
+    with fc_col1:
+        st.button("⬅️ Previous", disabled=(card_index == 0), key="fc_prev", on_click=step_flashcard, args=(-1,))
+    with fc_col2:
+        flip_text = "Show Answer" if st.session_state.flashcard_side == 'q' else "Show Question"
+        st.button(f"🔄 {flip_text}", key="fc_flip", on_click=flip_flashcard)
+    with fc_col3:
+         st.button("Next ➡️", disabled=(card_index == len(flashcards) - 1), key="fc_next", on_click=step_flashcard, args=(1,))
+
+    # Grading (once the answer is shown) schedules the card's next review
+    if st.session_state.flashcard_side == 'a':
+        st.caption("How well did you remember it?")
+        for grade_col, (grade_label, quality) in zip(st.columns(len(SRS_GRADES)), SRS_GRADES.items()):
+            with grade_col:
+                st.button(
+                    grade_label,
+                    key=f"fc_grade_{quality}",
+                    on_click=grade_flashcard,
+                    args=(card_index, current_card, quality, len(flashcards)),
+                )
+
+@st.fragment
+def render_mixed_review():
+    """Mixed review card viewer. Each card is looked up by its deck entry, not by walking the syllabus."""
+    deck = st.session_state.review_deck
+    position = st.session_state.review_position
+    subject, topic, subtopic, card_index = deck[position]
+    flashcards = load_subtopic(subject, topic, subtopic).get("flashcards", [])
+
+    st.subheader(f"Card {position + 1} / {len(deck)}")
+    st.caption(f"{subject} › {topic} › {subtopic}")
+    card = flashcards[card_index] if card_index < len(flashcards) else None
+    if card is None:
+        st.warning("This card was removed from the syllabus after the review started.")
+    elif st.session_state.review_side == 'q':
+        st.markdown(f"**Question:**\n> {card['q']}")
+    else:
+        st.markdown(f"**Answer:**\n> {card['a']}")
+
+    rv_col1, rv_col2, rv_col3 = st.columns(3)
+    with rv_col1:
+        st.button("⬅️ Previous", disabled=(position == 0), key="rv_prev", on_click=step_review_card, args=(-1,))
+    with rv_col2:
+        flip_text = "Show Answer" if st.session_state.review_side == 'q' else "Show Question"
+        st.button(f"🔄 {flip_text}", disabled=card is None, key="rv_flip", on_click=flip_review_card, args=(subject, topic, subtopic))
+    with rv_col3:
+        st.button("Next ➡️", disabled=(position == len(deck) - 1), key="rv_next", on_click=step_review_card, args=(1,))
+
+    if card is not None and st.session_state.review_side == 'a':
+        st.caption("How well did you remember it?")
+        for grade_col, (grade_label, quality) in zip(st.columns(len(SRS_GRADES)), SRS_GRADES.items()):
+            with grade_col:
+                st.button(
+                    grade_label,
+                    key=f"rv_grade_{quality}",
+                    on_click=grade_review_card,
+                    args=(subject, topic, subtopic, card_index, card, quality),
+                )
+
+# One <audio> element that plays a job's clips back to back. A clip still being generated
+# isn't in the store yet, so the player polls for it before moving on.
+TTS_PLAYLIST_HTML = """
+<audio id="player" controls autoplay style="width: 100%"></audio>
+<div id="part" style="font-family: sans-serif; font-size: 0.8rem; color: #808495"></div>
+<script>
+const parts = __PARTS__;
+const player = document.getElementById("player");
+const label = document.getElementById("part");
+let current = 0;
+async function clipReady(url) {
+  try {
+    return (await fetch(url, {method: "HEAD", cache: "no-store"})).ok;
+  } catch (e) {
+    return false;
+  }
+}
+async function playPart(index) {
+  current = index;
+  if (parts.length > 1) label.textContent = `Part ${index + 1} of ${parts.length}`;
+  while (!(await clipReady(parts[index]))) {
+    await new Promise(resolve => setTimeout(resolve, __POLL_MS__));
+  }
+  player.src = parts[index];
+  player.play().catch(() => {});
+}
+player.addEventListener("ended", () => {
+  if (current + 1 < parts.length) playPart(current + 1);
+});
+playPart(0);
+</script>
+"""
+
+def tts_playlist_html(urls):
+    """The Read Aloud player for a job whose clips are served at urls, in order."""
+    return TTS_PLAYLIST_HTML.replace("__PARTS__", json.dumps(urls)).replace("__POLL_MS__", str(TTS_POLL_SECONDS * 1000))
+
+def render_tts_job(job_key, polling):
+    """Shows a Read Aloud job's player and progress.
+
+    Runs as a fragment that polls every TTS_POLL_SECONDS while the job is running. Once it
+    finishes, one full rerun redraws it without the timer (a fragment can't cancel its own).
+    In a browser, one player starts on part 1 as soon as it's ready and moves on to each
+    later part by itself. Its HTML only depends on the job, so polling doesn't reload it.
+    Without clip URLs, the parts are joined into one clip once they're all ready.
+    """
+    job = get_tts_job(job_key)
+    if polling and (job is None or job["status"] != "running"):
+        st.rerun()
+    if job is None:
+        return
+    if job["status"] in ("failed", "cancelled"):
+        st.error(f"Failed to generate audio: {job['error'] or 'the request was cancelled'}")
+        return
+    if any(ready and not tts_cache_path(key).exists() for ready, key in zip(job["ready"], job["clip_keys"])):
+        st.warning("This audio was cleared from the cache. Click the button again to regenerate it.")
+        return
+    sources = [tts_audio_source(key) for key in job["clip_keys"]]
+    if all(isinstance(source, str) for source in sources):
+        components.html(tts_playlist_html(sources), height=TTS_PLAYER_HEIGHT)
+    elif job["status"] == "done":
+        # AppTest or static serving off: MP3 clips concatenate into one playable clip
+        st.audio(b"".join(source.read_bytes() for source in sources), format='audio/mpeg', autoplay=True)
+    if job["status"] == "running":
+        st.progress(sum(job["ready"]) / len(job["ready"]), text="Generating audio...")
+
+@st.fragment
+def render_read_aloud(label, speech, key):
+    """Read Aloud button. Audio is made by a background job, so the page stays usable meanwhile.
+
+    speech returns the text to read. It is only called on a click, so reruns don't compile anything.
+    """
+    session_jobs = st.session_state.setdefault("tts_jobs", {}) # button key -> job key
+    if st.button(label, key=key):
+        job = submit_tts_job(speech(), current_session_id())
+        if job is None:
+            st.warning("Too many audio requests right now. Please try again in a moment.")
+        else:
+            session_jobs[key] = job["key"]
+    job = get_tts_job(session_jobs.get(key))
+    if job is not None:
+        polling = job["status"] == "running"
+        st.fragment(render_tts_job, run_every=TTS_POLL_SECONDS if polling else None)(job["key"], polling)
+
+# --- Command line ---
+# `python "code (3).py" --prewarm-tts` fills the TTS cache for the whole syllabus and exits, so a
+# deploy can run it before the server takes students. It reads the same STUDY_HUB_* settings.
+if get_script_run_ctx() is None and "--prewarm-tts" in sys.argv[1:]:
+    prewarm_tts_command()
+
+# --- Page ---
+# The page runs inside try/finally so the rerun bookkeeping below still happens when
+# the script raises or is interrupted by a rerun (and the profiler is always disabled).
+try:
+    # Set STUDY_HUB_PREWARM_TTS=1 to fill the TTS cache in the background at startup instead
+    if os.environ.get("STUDY_HUB_PREWARM_TTS") == "1":
+        start_tts_prewarm()
+
+    init_user_store()
+
+    # --- Initialize Session State ---
+    if 'logged_in' not in st.session_state:
+        st.session_state.logged_in = False
+        st.session_state.username = None
+        st.session_state.current_subject = None
+        st.session_state.current_topic = None
+        st.session_state.current_subtopic = None
+        st.session_state.flashcard_index = 0
+        st.session_state.flashcard_side = 'q' # 'q' for question, 'a' for answer
+        st.session_state.total_study_time = 0.0
+        st.session_state.last_interaction_time = time.time()
+        st.session_state.study_start_time = None # When user starts viewing specific content
+
+    # Full script passes in this session (fragment reruns don't count); read by benchmarks/
+    st.session_state.script_runs = st.session_state.get("script_runs", 0) + 1
+
+    # --- Login/Registration Logic ---
+    if not st.session_state.logged_in:
+        st.set_page_config(page_title="O-Level Study Hub - Login", layout="centered")
+        st.title("📚 O-Level Study Hub")
+        st.write("Welcome! Please log in or register.")
+
+        login_tab, register_tab = st.tabs(["Login", "Register"])
+
+        with login_tab:
+            with st.form("login_form"):
+                st.text_input("Username", key="login_user")
+                st.text_input("Password", type="password", key="login_pass")
+                st.form_submit_button("Login", on_click=log_in)
+
+                # Feedback from the log_in() callback (on success the main app renders instead)
+                login_message = st.session_state.pop("login_message", None)
+                if login_message:
+                    getattr(st, login_message[0])(login_message[1])
+
+        with register_tab:
+             with st.form("register_form"):
+                reg_username = st.text_input("Choose Username", key="reg_user")
+                reg_password = st.text_input("Choose Password", type="password", key="reg_pass")
+                reg_password_confirm = st.text_input("Confirm Password", type="password", key="reg_pass_confirm")
+                register_button = st.form_submit_button("Register")
+
+                if register_button:
+                    if not reg_username or not reg_password:
+                        st.warning("Please enter both username and password.")
+                    elif reg_password != reg_password_confirm:
+                        st.warning("Passwords do not match.")
+                    elif reg_username in ADMIN_USERNAMES: # Otherwise anyone could claim an admin name before its owner does
+                        st.warning("This username is reserved.")
+                    elif load_user_data(reg_username) is not None: # Cheap early exit; create_user() decides
+                        st.warning("Username already exists.")
+                    elif len(reg_password) < MIN_PASSWORD_LENGTH:
+                         st.warning(f"Password must be at least {MIN_PASSWORD_LENGTH} characters long.")
                     else:
-                        st.error("Registration failed. Could not save user data.")
-# --- Main Application (Logged In) ---
-else:
-    st.set_page_config(page_title=f"Study Hub - {st.session_state.username}", layout="wide")
+                        hashed = hash_password(reg_password)
+                        if hashed is None:
+                            st.warning("The server is busy right now. Please try again in a moment.")
+                        else:
+                            created = create_user(reg_username, hashed)
+                            if created:
+                                count_event("registration")
+                                st.success(f"User '{reg_username}' registered successfully! Please log in.")
+                                # Optionally clear form or switch tab
+                            elif created is False:
+                                st.warning("Username already exists.") # Taken by a concurrent registration
+                            else:
+                                st.error("Registration failed. Could not save user data.")
+    # --- Main Application (Logged In) ---
+    else:
+        st.set_page_config(page_title=f"Study Hub - {st.session_state.username}", layout="wide")
 
-    # --- Idle Time Check ---
-    # Crude approximation: Check time since last interaction *during* a new interaction
-    now = time.time()
-    idle_duration = now - st.session_state.last_interaction_time
-    if idle_duration > SESSION_TIMEOUT_SECONDS:
-        # Don't log out automatically, just note potential idle time
-        st.toast(f"Welcome back! You were inactive for ~{idle_duration/60:.1f} minutes.", icon="👋")
-        # Add logic here if you want to track *confirmed* idle time vs active study time
-    st.session_state.last_interaction_time = now # Update last interaction time
-
-    # --- Sidebar Navigation ---
-    with st.sidebar:
-        st.title(f"Welcome, {st.session_state.username}!")
-        st.markdown("---")
+        # --- Idle Time Check ---
+        # Crude approximation: Check time since last interaction *during* a new interaction
+        now = time.time()
+        idle_duration = now - st.session_state.last_interaction_time
+        if idle_duration > SESSION_TIMEOUT_SECONDS:
+            # Don't log out automatically, just note potential idle time
+            st.toast(f"Welcome back! You were inactive for ~{idle_duration/60:.1f} minutes.", icon="👋")
+            # Add logic here if you want to track *confirmed* idle time vs active study time
+        st.session_state.last_interaction_time = now # Update last interaction time
+        flush_study_events() # Write buffered study events if the batch is due
 
-        # Subject Selection
-        st.header("My Subjects")
-        selected_subject = st.radio(
-            "Choose a subject:",
-            options=list(syllabus.keys()),
-            key="subject_selector",
-            index=list(syllabus.keys()).index(st.session_state.current_subject) if st.session_state.current_subject else 0,
-            format_func=lambda x: f"🎓 {x}" # Add emoji
-        )
+        navigation = get_navigation() # Built once per process, not on every rerun
 
-        # Update session state if subject changed
-        if selected_subject != st.session_state.current_subject:
-            update_study_time() # Stop timer for previous content
-            st.session_state.current_subject = selected_subject
-            st.session_state.current_topic = None # Reset lower levels
-            st.session_state.current_subtopic = None
-            st.session_state.flashcard_index = 0
-            st.rerun() # Rerun to update topic list
-
-        # Topic/Subtopic Selection (conditional)
-        if st.session_state.current_subject:
+        # --- Sidebar Navigation ---
+        with st.sidebar:
+            st.title(f"Welcome, {st.session_state.username}!")
             st.markdown("---")
-            st.subheader(f"Topics in {st.session_state.current_subject}")
-            subject_topics = list(syllabus[st.session_state.current_subject].keys())
-            if subject_topics:
-                 selected_topic = st.selectbox(
-                     "Select Topic:",
-                     options=subject_topics,
-                     key="topic_selector",
-                     index=subject_topics.index(st.session_state.current_topic) if st.session_state.current_topic else 0
-                 )
-                 if selected_topic != st.session_state.current_topic:
-                      update_study_time() # Stop timer
-                      st.session_state.current_topic = selected_topic
-                      st.session_state.current_subtopic = None # Reset subtopic
-                      st.session_state.flashcard_index = 0
-                      st.rerun()
-
-            if st.session_state.current_topic:
-                st.markdown("---")
-                st.subheader(f"Subtopics in {st.session_state.current_topic}")
-                topic_subtopics = list(syllabus[st.session_state.current_subject][st.session_state.current_topic].keys())
-                if topic_subtopics:
-                    selected_subtopic = st.radio(
-                         "Select Subtopic:",
-                         options=topic_subtopics,
-                         key="subtopic_selector",
-                         index=topic_subtopics.index(st.session_state.current_subtopic) if st.session_state.current_subtopic else 0
+
+            # Search
+            search_query = st.text_input("🔍 Search notes and flashcards", key="search_query")
+            if search_query:
+                search_results = search_syllabus(search_query)
+                if not search_results:
+                    st.caption("No matches found.")
+                for i, result in enumerate(search_results):
+                    st.button(
+                        f"{result['subtopic']} · {result['subject']} › {result['topic']}",
+                        key=f"search_result_{i}",
+                        on_click=open_subtopic,
+                        args=(result["subject"], result["topic"], result["subtopic"], result["tab"]),
                     )
-                    if selected_subtopic != st.session_state.current_subtopic:
-                         update_study_time() # Stop timer
-                         st.session_state.current_subtopic = selected_subtopic
-                         st.session_state.flashcard_index = 0
-                         st.session_state.study_start_time = time.time() # Start timer for new content
-                         st.rerun()
-                else:
-                     st.write("No subtopics available for this topic yet.")
+            st.markdown("---")
 
-        # Study Time Display
-        st.markdown("---")
-        st.header("Study Stats")
-        total_seconds = st.session_state.total_study_time
-        hours, remainder = divmod(total_seconds, 3600)
-        minutes, seconds = divmod(remainder, 60)
-        st.metric("Approx. Study Time", f"{int(hours)}h {int(minutes)}m {int(seconds)}s")
-        st.caption("Time spent actively viewing content.")
+            # Subject Selection
+            st.header("My Subjects")
+            selected_subject = st.radio(
+                "Choose a subject:",
+                options=navigation["subjects"],
+                key="subject_selector",
+                index=navigation["subject_index"].get(st.session_state.current_subject, 0),
+                format_func=lambda x: f"🎓 {x}", # Add emoji
+                on_change=select_subject,
+            )
+            if st.session_state.current_subject is None:
+                st.session_state.current_subject = selected_subject # Default selection, no rerun needed
+
+            # Topic/Subtopic Selection (conditional)
+            if st.session_state.current_subject:
+                st.markdown("---")
+                st.subheader(f"Topics in {st.session_state.current_subject}")
+                subject_topics = navigation["topics"].get(st.session_state.current_subject, [])
+                if subject_topics:
+                     selected_topic = st.selectbox(
+                         "Select Topic:",
+                         options=subject_topics,
+                         key="topic_selector",
+                         index=navigation["topic_index"][st.session_state.current_subject].get(st.session_state.current_topic, 0),
+                         on_change=select_topic,
+                     )
+                     if st.session_state.current_topic is None:
+                          st.session_state.current_topic = selected_topic
+
+                if st.session_state.current_topic:
+                    st.markdown("---")
+                    st.subheader(f"Subtopics in {st.session_state.current_topic}")
+                    topic_key = (st.session_state.current_subject, st.session_state.current_topic)
+                    topic_subtopics = navigation["subtopics"].get(topic_key, [])
+                    if topic_subtopics:
+                        selected_subtopic = st.radio(
+                             "Select Subtopic:",
+                             options=topic_subtopics,
+                             key="subtopic_selector",
+                             index=navigation["subtopic_index"][topic_key].get(st.session_state.current_subtopic, 0),
+                             on_change=select_subtopic,
+                        )
+                        if st.session_state.current_subtopic is None:
+                             st.session_state.current_subtopic = selected_subtopic
+                             st.session_state.flashcard_index = 0
+                             st.session_state.flashcard_side = 'q'
+                             st.session_state.open_tab = None
+                             st.session_state.study_start_time = time.time() # Start timer for new content
+                    else:
+                         st.write("No subtopics available for this topic yet.")
+
+            # Study Time Display
+            st.markdown("---")
+            st.header("Study Stats")
+            total_seconds = st.session_state.total_study_time
+            hours, remainder = divmod(total_seconds, 3600)
+            minutes, seconds = divmod(remainder, 60)
+            st.metric("Approx. Study Time", f"{int(hours)}h {int(minutes)}m {int(seconds)}s")
+            st.caption("Total time spent actively viewing content.")
+
+            # Spaced repetition
+            st.markdown("---")
+            st.header("Flashcard Review")
+            due_count = count_due_flashcards(st.session_state.username)
+            st.metric("Cards Due", due_count)
+            st.button("Review Next Due Card", disabled=(due_count == 0), on_click=open_next_due_flashcard)
+            with st.expander("Mixed Review"):
+                st.multiselect("Subjects", navigation["subjects"], key="review_subjects", placeholder="All subjects")
+                st.number_input("Cards", min_value=1, max_value=MIXED_REVIEW_MAX_CARDS, value=MIXED_REVIEW_DEFAULT_CARDS, key="review_size")
+                st.checkbox("Focus on cards I often miss", key="review_weak_first")
+                st.button("Start Mixed Review", key="start_review", on_click=start_mixed_review)
+                review_message = st.session_state.pop("review_message", None)
+                if review_message:
+                    st.warning(review_message)
+
+            # Bulk import (admins only, see STUDY_HUB_ADMINS)
+            if st.session_state.username in ADMIN_USERNAMES:
+                st.markdown("---")
+                with st.expander("Bulk Import Students"):
+                    student_csv = st.file_uploader("CSV with username and password columns", type="csv", key="import_csv")
+                    if st.button("Import Students", disabled=student_csv is None, key="import_students"):
+                        try:
+                            rows = read_student_csv(student_csv.getvalue())
+                        except (ValueError, UnicodeDecodeError, csv.Error) as e:
+                            st.error(f"Could not read the CSV: {e}")
+                        else:
+                            progress = st.progress(0.0, text="Hashing passwords...")
+                            report = import_students(rows, lambda done, total: progress.progress(done / total, text=f"Imported {done} of {total}"))
+                            progress.empty()
+                            st.session_state.import_report = import_report_csv(report)
+                            st.session_state.import_summary = {
+                                status: sum(1 for row in report if row[1] == status)
+                                for status in ("created", "exists", "duplicate", "invalid", "failed")
+                            }
+                    if st.session_state.get("import_summary"):
+                        summary = st.session_state.import_summary
+                        st.caption(", ".join(f"{count} {status}" for status, count in summary.items() if count))
+                        st.download_button("Download Import Report", st.session_state.import_report, file_name="import_report.csv", mime="text/csv")
+
+            # Logout Button
+            st.markdown("---")
+            st.button("Logout", type="primary", on_click=log_out)
 
 
-        # Logout Button
+        # --- Main Content Area ---
+        st.header(f"Subject: {st.session_state.current_subject or 'Select a Subject'}")
+        st.subheader(f"Topic: {st.session_state.current_topic or 'Select a Topic'}")
         st.markdown("---")
-        if st.button("Logout", type="primary"):
-            update_study_time() # Record time before logging out
-            # Save progress/stats before logging out if needed (e.g., to user file)
-            st.session_state.logged_in = False
-            st.session_state.username = None
-            # Clear sensitive session state keys
-            keys_to_clear = ['current_subject', 'current_topic', 'current_subtopic', 'flashcard_index', 'flashcard_side', 'study_start_time']
-            for key in keys_to_clear:
-                 if key in st.session_state:
-                     del st.session_state[key]
-            st.rerun()
-
-
-    # --- Main Content Area ---
-    st.header(f"Subject: {st.session_state.current_subject or 'Select a Subject'}")
-    st.subheader(f"Topic: {st.session_state.current_topic or 'Select a Topic'}")
-    st.markdown("---")
 
-    if st.session_state.current_subtopic:
-        st.title(f"Subtopic: {st.session_state.current_subtopic}")
+        if st.session_state.get("review_deck"):
+            st.title("Mixed Review")
+            st.button("End Review", key="end_review", on_click=end_mixed_review)
+            render_mixed_review()
 
-        subtopic_data = syllabus.get(st.session_state.current_subject, {}).get(st.session_state.current_topic, {}).get(st.session_state.current_subtopic, {})
+        elif st.session_state.current_subtopic:
+            st.title(f"Subtopic: {st.session_state.current_subtopic}")
 
-        # Display Content using Tabs for organization
-        detail_tab, notes_tab, flash_tab = st.tabs(["📖 Detailed Explanation", "📝 Revision Notes", "💡 Flashcards"])
+            # Only this subtopic's pack is loaded; other subjects' bodies stay on disk
+            subtopic_data = load_subtopic(st.session_state.current_subject, st.session_state.current_topic, st.session_state.current_subtopic)
 
-        with detail_tab:
-            content_detail = subtopic_data.get("detail", "No detailed explanation available yet.")
-            st.markdown(content_detail) # Use markdown for formatting
+            # Display Content using Tabs for organization
+            detail_tab, notes_tab, flash_tab = st.tabs(list(CONTENT_TABS.values()), default=st.session_state.get("open_tab"))
 
-            # TTS Button for Detail
-            st.markdown("---")
-            if st.button("🔊 Read Explanation Aloud", key="tts_detail"):
-                with st.spinner("Generating audio..."):
-                     audio_bytes = generate_tts_audio(content_detail)
-                     if audio_bytes:
-                         st.audio(audio_bytes, format='audio/mp3')
-                     else:
-                         st.error("Could not generate audio.")
-
-        with notes_tab:
-            content_notes = subtopic_data.get("notes", "No revision notes available yet.")
-            st.markdown(content_notes)
-
-            # TTS Button for Notes
-            st.markdown("---")
-            if st.button("🔊 Read Notes Aloud", key="tts_notes"):
-                 with st.spinner("Generating audio..."):
-                     audio_bytes = generate_tts_audio(content_notes)
-                     if audio_bytes:
-                         st.audio(audio_bytes, format='audio/mp3')
-                     else:
-                         st.error("Could not generate audio.")
-
-        with flash_tab:
-            flashcards = subtopic_data.get("flashcards", [])
-            if flashcards:
-                card_index = st.session_state.flashcard_index
-                current_card = flashcards[card_index]
-
-                # Display current card (Question or Answer)
-                st.subheader(f"Flashcard {card_index + 1} / {len(flashcards)}")
-                card_container = st.container() # To redraw card content easily
-                with card_container:
-                     if st.session_state.flashcard_side == 'q':
-                         st.markdown(f"**Question:**\n> {current_card['q']}")
-                     else:
-                         st.markdown(f"**Answer:**\n> {current_card['a']}")
-
-                # Flashcard Controls
-                fc_col1, fc_col2, fc_col3 = st.columns(3)
-                with fc_col1:
-                    if st.button("⬅️ Previous", disabled=(card_index == 0), key="fc_prev"):
-                        st.session_state.flashcard_index -= 1
-                        st.session_state.flashcard_side = 'q' # Reset to question
-                        st.rerun()
-                with fc_col2:
-                    flip_text = "Show Answer" if st.session_state.flashcard_side == 'q' else "Show Question"
-                    if st.button(f"🔄 {flip_text}", key="fc_flip"):
-                        st.session_state.flashcard_side = 'a' if st.session_state.flashcard_side == 'q' else 'q'
-                        st.rerun()
-                with fc_col3:
-                     if st.button("Next ➡️", disabled=(card_index == len(flashcards) - 1), key="fc_next"):
-                         st.session_state.flashcard_index += 1
-                         st.session_state.flashcard_side = 'q' # Reset to question
-                         st.rerun()
-            else:
-                st.write("No flashcards available for this subtopic yet.")
+            with detail_tab:
+                missing = "No detailed explanation available yet."
+                with timed("render_markdown"):
+                    st.markdown(subtopic_data.get("detail", missing)) # Use markdown for formatting
 
-    elif st.session_state.current_topic:
-         st.info("Select a subtopic from the sidebar to view its content.")
-    elif st.session_state.current_subject:
-        st.info("Select a topic from the sidebar.")
-    else:
-        st.info("Select a subject from the sidebar to begin learning!")
+                # TTS Button for Detail (reads the markup-free speech text)
+                st.markdown("---")
+                render_read_aloud("🔊 Read Explanation Aloud", functools.partial(open_subtopic_speech, "detail", missing), key="tts_detail")
+
+            with notes_tab:
+                missing = "No revision notes available yet."
+                with timed("render_markdown"):
+                    st.markdown(subtopic_data.get("notes", missing))
+
+                # TTS Button for Notes
+                st.markdown("---")
+                render_read_aloud("🔊 Read Notes Aloud", functools.partial(open_subtopic_speech, "notes", missing), key="tts_notes")
+
+            with flash_tab:
+                flashcards = subtopic_data.get("flashcards", [])
+                if flashcards:
+                    render_flashcards(flashcards)
+                else:
+                    st.write("No flashcards available for this subtopic yet.")
+
+        elif st.session_state.current_topic:
+             st.info("Select a subtopic from the sidebar to view its content.")
+        elif st.session_state.current_subject:
+            st.info("Select a topic from the sidebar.")
+        else:
+            st.info("Select a subject from the sidebar to begin learning!")
+
+        # Simple footer or separator
+        st.markdown("---")
+        st.caption("O-Level Study Hub | Happy Learning!")
+finally:
+    # --- Allocation Profile ---
+    # Run with STUDY_HUB_ALLOC_PROFILE=1 to check that static data isn't rebuilt on every rerun
+    if ALLOC_PROFILE:
+        log_rerun_allocations(rerun_alloc_snapshot)
 
-    # Simple footer or separator
-    st.markdown("---")
-    st.caption("O-Level Study Hub | Happy Learning!")
\ No newline at end of file
+    # --- Metrics ---
+    finish_rerun(rerun_started, rerun_profiler)